@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WRL_DATA_CSV = os.path.join(REPO_DIR, 'data', 'country', 'WRL_data.csv')
+
+
+class CountryQuerySet(list):
+    def first(self):
+        return self[0] if self else None
+
+    def values_list(self, field, flat=False):
+        return CountryQuerySet([getattr(country, field) for country in self])
+
+
+class CountryManager:
+    def __init__(self):
+        self.rows = {}
+
+    def filter(self, country_code=None):
+        return CountryQuerySet([self.rows[country_code]] if country_code in self.rows else [])
+
+
+class Country:
+    """Stand-in for paths.models.Country, holding country_df as the orient='split' JSON the real model stores."""
+    objects = CountryManager()
+
+    def __init__(self, country_code, country_df):
+        self.country_code = country_code
+        self.country_df = country_df
+
+
+class Signal:
+    """Stand-in for a django.db.models.signals signal: utils connect receivers at import, which never fire here."""
+
+    def connect(self, receiver, sender=None, dispatch_uid=None, **kwargs):
+        pass
+
+
+def install_signals_stand_in():
+    """Provide django.db.models.signals when Django is not installed, for the utils that connect to them."""
+    try:
+        import django.db.models.signals
+    except ImportError:
+        modules = {name: types.ModuleType(name) for name in
+                   ['django', 'django.db', 'django.db.models', 'django.db.models.signals']}
+        modules['django.db.models.signals'].post_save = Signal()
+        modules['django.db.models.signals'].post_delete = Signal()
+        modules['django'].db = modules['django.db']
+        modules['django.db'].models = modules['django.db.models']
+        modules['django.db.models'].signals = modules['django.db.models.signals']
+        sys.modules.update(modules)
+
+
+def install_country_stand_in(csv_path=WRL_DATA_CSV):
+    """Serve WRL from csv_path through a stand-in paths.models module, so neither a database nor Django is needed.
+    Must run before anything from utils that imports paths.models."""
+    install_signals_stand_in()
+    Country.objects.rows['WRL'] = Country('WRL', pd.read_csv(csv_path).to_json(orient='split'))
+    paths_module = types.ModuleType('paths')
+    models_module = types.ModuleType('paths.models')
+    models_module.Country = Country
+    models_module.Path = BenchPath
+    paths_module.models = models_module
+    sys.modules['paths'] = paths_module
+    sys.modules['paths.models'] = models_module
+
+
+class BenchCleanTech:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class BenchCleanTechList(list):
+    def all(self):
+        return list(self)
+
+
+class BenchPath:
+    """Stand-in for paths.models.Path: create_path only reads cleantech_list and starting_year and sets outputs."""
+
+    def __init__(self, cleantechs, starting_year=2022):
+        self.pk = None
+        self.cleantech_list = BenchCleanTechList(cleantechs)
+        self.starting_year = starting_year
+
+    def save(self):
+        pass
+
+
+def make_cleantechs(n_cleantechs, seed=0):
+    """Synthetic CleanTechs cycling through subsector reducers, fossil-powered reducers and carbon-free generators
+    that replace fossil electricity."""
+    from utils.constants import SECTORS, CARBON_FREE_TYPES
+
+    rng = random.Random(seed)
+    subsectors = [subsector for sector_subsectors in SECTORS.values() for subsector in sector_subsectors]
+    cleantechs = []
+    for cleantech_num in range(n_cleantechs):
+        kind = cleantech_num % 3
+        fields = dict(id=cleantech_num + 1, name=f'CleanTech {cleantech_num + 1}',
+                      start_year=2022 + rng.randint(0, 15), before_start_year_units=rng.uniform(0, 10),
+                      start_year_units=rng.uniform(10, 100), growth_rate=rng.uniform(1.05, 1.5),
+                      saturation_rate=rng.uniform(0.05, 0.4), limit_perc=rng.uniform(0.1, 0.9),
+                      CO2_reduced_per_unit=0., electric_energy_per_unit=0., replace_fossil=False,
+                      electric_generation_type=None, all_subsectors=None)
+        if kind == 2:
+            fields.update(replace_fossil=True, electric_energy_per_unit=rng.uniform(1e-4, 1e-2),
+                          electric_generation_type=CARBON_FREE_TYPES[cleantech_num % len(CARBON_FREE_TYPES)])
+        else:
+            fields.update(CO2_reduced_per_unit=rng.uniform(1e3, 1e5),
+                          all_subsectors=json.dumps(rng.sample(subsectors, rng.randint(1, 4))))
+            if kind == 1:
+                fields.update(electric_generation_type='fossil', electric_energy_per_unit=rng.uniform(1e-6, 1e-4))
+        cleantechs.append(BenchCleanTech(**fields))
+    return cleantechs
+
+
+def measure(run, repeats):
+    """Wall times of repeats untraced runs, then peak traced memory and net allocated blocks of one traced run."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.reset_peak()
+    result = run()
+    _, peak = tracemalloc.get_traced_memory()
+    blocks = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+    return result, {'wall_time_s': min(times), 'wall_time_median_s': statistics.median(times),
+                    'peak_memory_bytes': peak, 'allocated_blocks': blocks}
+
+
+def benchmark_phases(engine, n_cleantechs, repeats, seed=0):
+    from utils.allcarbonfree_calcs import CleanTechObj, Path, create_path, get_path_outputs
+    from utils.country_baselines import get_country_baseline, invalidate_country_baseline
+
+    cleantechs = make_cleantechs(n_cleantechs, seed)
+
+    def load_baseline():
+        invalidate_country_baseline('WRL')
+        return get_country_baseline('WRL')
+
+    def new_path():
+        all_carbon_free = Path('WRL', engine=engine)
+        all_carbon_free.set_starting_year(2022)
+        all_carbon_free.set_cleantech_list([CleanTechObj(**cleantech.__dict__) for cleantech in cleantechs])
+        return all_carbon_free
+
+    def simulate():
+        all_carbon_free = new_path()
+        all_carbon_free.simulate()
+        return all_carbon_free
+
+    def calc_totals():
+        all_carbon_free.calc_totals()
+
+    def create():
+        create_path(BenchPath(cleantechs), engine=engine, use_cache=False)
+
+    results = []
+    _, stats = measure(load_baseline, repeats)
+    results.append(dict(stats, phase='baseline'))
+    all_carbon_free, stats = measure(simulate, repeats)
+    n_years = len(all_carbon_free.checkpoints)
+    results.append(dict(stats, phase='simulate', years=n_years, years_per_s=n_years / stats['wall_time_s']))
+    _, stats = measure(calc_totals, repeats)
+    results.append(dict(stats, phase='calc_totals'))
+    _, stats = measure(lambda: get_path_outputs(all_carbon_free), repeats)
+    results.append(dict(stats, phase='outputs'))
+    _, stats = measure(create, repeats)
+    results.append(dict(stats, phase='create_path', years=n_years, years_per_s=n_years / stats['wall_time_s']))
+    return [dict(result, engine=engine, n_cleantechs=n_cleantechs) for result in results]
+
+
+def run_benchmarks(engines=('dict', 'array'), sizes=None, repeats=5, seed=0):
+    from utils.constants import USER_CLEANTECH_LIMIT
+
+    sizes = [1, 10, USER_CLEANTECH_LIMIT] if sizes is None else sizes
+    results = []
+    for engine in engines:
+        for n_cleantechs in sizes:
+            results += benchmark_phases(engine, n_cleantechs, repeats, seed)
+    return {'meta': {'time': datetime.utcnow().isoformat(), 'python': platform.python_version(),
+                     'numpy': np.__version__, 'pandas': pd.__version__, 'platform': platform.platform(),
+                     'repeats': repeats, 'seed': seed},
+            'results': results}
+
+
+def compare_results(baseline, current, threshold=1.2):
+    """(engine, n_cleantechs, phase, baseline s, current s) of every phase whose best wall time grew more than
+    threshold times."""
+    baseline_times = {(result['engine'], result['n_cleantechs'], result['phase']): result['wall_time_s']
+                      for result in baseline['results']}
+    slowdowns = []
+    for result in current['results']:
+        key = (result['engine'], result['n_cleantechs'], result['phase'])
+        if key in baseline_times and result['wall_time_s'] > threshold * baseline_times[key]:
+            slowdowns.append(key + (baseline_times[key], result['wall_time_s']))
+    return slowdowns
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Path.simulate and create_path on WRL_data.csv.')
+    parser.add_argument('--engine', action='append', choices=['dict', 'array'],
+                        help='Engine to benchmark (repeatable); both if omitted')
+    parser.add_argument('--size', type=int, action='append', help='Number of CleanTechs (repeatable)')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='Earlier results file; exit 1 if any phase is slower than --threshold')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    install_country_stand_in()
+    results = run_benchmarks(args.engine or ('dict', 'array'), args.size, args.repeats, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    for result in results['results']:
+        years_per_s = f"{result['years_per_s']:10.0f} years/s" if 'years_per_s' in result else ''
+        print(f"{result['engine']:>5} {result['n_cleantechs']:>3} {result['phase']:<12} "
+              f"{result['wall_time_s'] * 1000:9.2f} ms {result['peak_memory_bytes'] / 1e6:8.2f} MB {years_per_s}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            slowdowns = compare_results(json.load(f), results, args.threshold)
+        for engine, n_cleantechs, phase, before, after in slowdowns:
+            print(f'Slower: {engine} {n_cleantechs} {phase} {before * 1000:.2f} ms -> {after * 1000:.2f} ms')
+        if slowdowns:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, REPO_DIR)
+    main()
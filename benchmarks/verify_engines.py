@@ -0,0 +1,228 @@
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import numpy as np
+from benchmark_paths import REPO_DIR, BenchCleanTech, install_country_stand_in
+
+ENGINES = ['array', 'batch', 'path_engine']
+
+
+def make_cleantech(rng, cleantech_id, electric_generation_type, replace_fossil):
+    """A random CleanTech with the given generation type, replacing fossil electricity or reducing 1-4 subsectors."""
+    from utils.constants import CARBON_FREE_TYPES, SUBSECTORS
+
+    fields = dict(id=cleantech_id, name=f'CleanTech {cleantech_id}', start_year=rng.randint(2015, 2050),
+                  before_start_year_units=rng.uniform(0, 10), start_year_units=rng.uniform(10, 1000),
+                  growth_rate=rng.uniform(1.0, 1.6), saturation_rate=rng.uniform(0.01, 1.0),
+                  limit_perc=rng.uniform(0.05, 1.0), electric_generation_type=electric_generation_type,
+                  replace_fossil=replace_fossil, all_subsectors=None, CO2_reduced_per_unit=0.,
+                  electric_energy_per_unit=rng.uniform(0, 1e-3))
+    if replace_fossil or electric_generation_type in CARBON_FREE_TYPES:
+        fields['electric_energy_per_unit'] = rng.uniform(1e-4, 5.)
+    if not replace_fossil:
+        fields.update(CO2_reduced_per_unit=rng.uniform(1e2, 1e6),
+                      all_subsectors=json.dumps(rng.sample(SUBSECTORS, rng.randint(1, 4))))
+    return BenchCleanTech(**fields)
+
+
+def make_capture_cleantech(rng, cleantech_id):
+    """A CleanTech reducing every subsector fast enough to take all emissions below MAKE_ZERO, for early
+    termination."""
+    from utils.constants import SUBSECTORS
+
+    return BenchCleanTech(id=cleantech_id, name=f'Capture {cleantech_id}', start_year=rng.randint(2022, 2035),
+                          before_start_year_units=0., start_year_units=100., growth_rate=rng.uniform(1.4, 1.6),
+                          saturation_rate=1., limit_perc=1., electric_generation_type=None,
+                          replace_fossil=False, all_subsectors=json.dumps(SUBSECTORS), CO2_reduced_per_unit=1e6,
+                          electric_energy_per_unit=1e-3)
+
+
+def make_scenarios(n_scenarios, max_cleantechs, seed=0):
+    """CleanTech sets to verify. The first holds one CleanTech for every ELECTRIC_TYPES value with replace_fossil on
+    and off; the rest draw both at random, and about a third add a capture CleanTech that ends the run early."""
+    from utils.constants import ELECTRIC_TYPES
+
+    rng = random.Random(seed)
+    scenarios = [[make_cleantech(rng, cleantech_num + 1, electric_generation_type, replace_fossil)
+                  for cleantech_num, (electric_generation_type, replace_fossil) in
+                  enumerate([(generation_type, replace) for generation_type in ELECTRIC_TYPES
+                             for replace in (False, True)])]]
+    while len(scenarios) < n_scenarios:
+        cleantechs = [make_cleantech(rng, cleantech_num + 1, rng.choice(ELECTRIC_TYPES), rng.random() < 0.4)
+                      for cleantech_num in range(rng.randint(1, max_cleantechs))]
+        if rng.random() < 0.35:
+            cleantechs.insert(rng.randint(0, len(cleantechs)), make_capture_cleantech(rng, len(cleantechs) + 1))
+        scenarios.append(cleantechs)
+    return scenarios[:n_scenarios]
+
+
+def get_coverage(scenarios):
+    cleantechs = [cleantech for cleantechs in scenarios for cleantech in cleantechs]
+    return {'electric_generation_type': sorted({str(cleantech.electric_generation_type) for cleantech in cleantechs}),
+            'replace_fossil': sorted({bool(cleantech.replace_fossil) for cleantech in cleantechs}),
+            'subsector_reducers': sum(1 for cleantech in cleantechs if cleantech.all_subsectors)}
+
+
+def get_result(frame_values, cleantechs, summary, run_time):
+    return {'values': frame_values, 'units': [np.asarray(cleantech.units_per_year, dtype=float)
+                                              for cleantech in cleantechs],
+            'summary': summary, 'time': run_time}
+
+
+def run_path(cleantechs, columns, engine):
+    from utils.allcarbonfree_calcs import CleanTechObj, Path, get_summary_outputs
+
+    start = time.perf_counter()
+    all_carbon_free = Path('WRL', engine=engine)
+    all_carbon_free.set_starting_year(2022)
+    all_carbon_free.set_cleantech_list([CleanTechObj(**cleantech.__dict__) for cleantech in cleantechs])
+    all_carbon_free.simulate()
+    all_carbon_free.calc_totals()
+    run_time = time.perf_counter() - start
+    return get_result(all_carbon_free.country_df[columns].to_numpy(dtype=float), all_carbon_free.cleantech_list,
+                      get_summary_outputs(all_carbon_free), run_time)
+
+
+def run_path_engine(cleantechs, columns):
+    from utils.country_baselines import get_country_baseline
+    from utils.path_engine import CleanTechParams, simulate_path
+
+    baseline = get_country_baseline('WRL').engine_baseline
+    start = time.perf_counter()
+    cleantech_params = [CleanTechParams(cleantech.__dict__) for cleantech in cleantechs]
+    run = simulate_path(baseline, cleantech_params)
+    summary = run.get_summary()
+    run_time = time.perf_counter() - start
+    return get_result(run.get_frame_values(columns), cleantech_params, summary, run_time)
+
+
+def run_batch(scenarios, columns):
+    """Path.simulate_batch of every scenario in one call; each result gets an equal share of its time."""
+    from utils.allcarbonfree_calcs import CleanTechObj, Path, get_summary_outputs
+
+    start = time.perf_counter()
+    all_carbon_free = Path('WRL', engine='array')
+    paths = all_carbon_free.simulate_batch([[CleanTechObj(**cleantech.__dict__) for cleantech in cleantechs]
+                                            for cleantechs in scenarios])
+    for path in paths:
+        path.calc_totals()
+    run_time = (time.perf_counter() - start) / len(scenarios)
+    return [get_result(path.country_df[columns].to_numpy(dtype=float), path.cleantech_list,
+                       get_summary_outputs(path), run_time) for path in paths]
+
+
+def compare_result(reference, result, columns, rtol, atol):
+    """Per-column divergence of result from reference over the years both simulated, and a list of failures.
+
+    A value fails when it differs from the reference by more than atol + rtol times the larger of its reference
+    value and the column's largest reference value, so cancellation near zero in a large column is not a failure.
+    """
+    failures = []
+    ref_values, values = reference['values'], result['values']
+    if len(ref_values) != len(values):
+        failures.append({'kind': 'years', 'reference': int(ref_values[-1, 0]), 'value': int(values[-1, 0])})
+    n_rows = min(len(ref_values), len(values))
+    ref_values, values = ref_values[:n_rows], values[:n_rows]
+
+    diff = np.abs(values - ref_values)
+    scale = np.maximum(np.abs(ref_values), np.abs(ref_values).max(axis=0))
+    rel = np.divide(diff, scale, out=np.zeros_like(diff), where=scale > 0)
+    failed = diff > atol + rtol * scale
+    divergence = {}
+    for column_num, column in enumerate(columns):
+        worst = int(np.argmax(rel[:, column_num]))
+        divergence[column] = {'max_abs': float(diff[:, column_num].max()), 'max_rel': float(rel[worst, column_num]),
+                              'year': int(ref_values[worst, 0])}
+        for row in np.flatnonzero(failed[:, column_num]):
+            failures.append({'kind': 'value', 'column': column, 'year': int(ref_values[row, 0]),
+                             'reference': float(ref_values[row, column_num]), 'value': float(values[row, column_num])})
+
+    for cleantech_num, (ref_units, units) in enumerate(zip(reference['units'], result['units'])):
+        if len(ref_units) != len(units):
+            failures.append({'kind': 'units_per_year length', 'cleantech': cleantech_num,
+                             'reference': len(ref_units), 'value': len(units)})
+        elif not np.allclose(units, ref_units, rtol=rtol, atol=atol):
+            failures.append({'kind': 'units_per_year', 'cleantech': cleantech_num,
+                             'max_abs': float(np.abs(units - ref_units).max())})
+
+    for key, ref_value in reference['summary'].items():
+        # int() truncation can move a total by one when the unrounded values differ in the last bits.
+        if abs(result['summary'][key] - ref_value) > (0 if key == 'carbon_zero_year' else 1):
+            failures.append({'kind': 'summary', 'column': key, 'reference': ref_value,
+                             'value': result['summary'][key]})
+    return divergence, failures
+
+
+def verify_engines(engines=ENGINES, n_scenarios=50, max_cleantechs=12, seed=0, rtol=1e-9, atol=1e-6):
+    """Run every scenario of make_scenarios through the dict engine and each engine in engines, and report each
+    engine's per-column divergence (the worst year over all scenarios), failures and speedup over the dict engine."""
+    from utils.country_baselines import get_country_baseline
+
+    baseline = get_country_baseline('WRL')
+    columns = ['year'] + [column for column in baseline.layout.columns if column in baseline.engine_baseline.columns]
+    scenarios = make_scenarios(n_scenarios, max_cleantechs, seed)
+    references = [run_path(cleantechs, columns, 'dict') for cleantechs in scenarios]
+    runs = {'array': lambda: [run_path(cleantechs, columns, 'array') for cleantechs in scenarios],
+            'batch': lambda: run_batch(scenarios, columns),
+            'path_engine': lambda: [run_path_engine(cleantechs, columns) for cleantechs in scenarios]}
+
+    coverage = dict(get_coverage(scenarios), early_termination=sum(
+        1 for reference in references if reference['summary']['carbon_zero_year'] < 2100))
+    report = {'seed': seed, 'n_scenarios': n_scenarios, 'rtol': rtol, 'atol': atol, 'coverage': coverage,
+              'engines': {}}
+    for engine in engines:
+        divergence = {column: {'max_abs': 0., 'max_rel': 0., 'year': None, 'scenario': None} for column in columns}
+        failures = []
+        results = runs[engine]()
+        for scenario_num, (reference, result) in enumerate(zip(references, results)):
+            scenario_divergence, scenario_failures = compare_result(reference, result, columns, rtol, atol)
+            for column, column_divergence in scenario_divergence.items():
+                if column_divergence['max_rel'] >= divergence[column]['max_rel']:
+                    divergence[column] = dict(column_divergence, scenario=scenario_num)
+            failures += [dict(failure, scenario=scenario_num) for failure in scenario_failures]
+        speedups = [reference['time'] / result['time'] for reference, result in zip(references, results)]
+        report['engines'][engine] = {'divergence': divergence, 'failures': failures,
+                                     'reference_time_s': sum(reference['time'] for reference in references),
+                                     'time_s': sum(result['time'] for result in results),
+                                     'median_speedup': statistics.median(speedups)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check alternative simulation engines against the dict engine on '
+                                                 'random CleanTech sets.')
+    parser.add_argument('--engine', action='append', choices=ENGINES, help='Engine to verify (repeatable); all if '
+                                                                          'omitted')
+    parser.add_argument('--scenarios', type=int, default=50)
+    parser.add_argument('--max-cleantechs', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rtol', type=float, default=1e-9)
+    parser.add_argument('--atol', type=float, default=1e-6)
+    parser.add_argument('--output', help='Write the full report as JSON')
+    args = parser.parse_args()
+
+    install_country_stand_in()
+    report = verify_engines(args.engine or ENGINES, args.scenarios, args.max_cleantechs, args.seed, args.rtol,
+                            args.atol)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    print(f"Coverage: {report['coverage']}")
+    for engine, engine_report in report['engines'].items():
+        worst_column, worst = max(engine_report['divergence'].items(), key=lambda item: item[1]['max_rel'])
+        print(f"{engine:>11}: {len(engine_report['failures'])} failures, worst {worst_column} "
+              f"{worst['max_rel']:.2e} rel in {worst['year']} (scenario {worst['scenario']}), "
+              f"{engine_report['median_speedup']:.2f}x median speedup")
+        for failure in engine_report['failures'][:10]:
+            print(f'    {failure}')
+    if any(engine_report['failures'] for engine_report in report['engines'].values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, REPO_DIR)
+    main()
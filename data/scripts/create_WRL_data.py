@@ -1,67 +1,152 @@
+import hashlib
+import json
+import os
 import pandas as pd
 from sector_conversions import SECTOR_CONV, GWP_AR5
-from utils.constants import SECTORS, CARBON_FREE_TYPES
+from utils.constants import SECTORS, CARBON_FREE_TYPES, COUNTRY_CODES
+from utils.country_store import CountryStore, write_country_store
 
 create_WRL_emissions = False
+rebuild = False  # Recreate every year instead of appending new ones, e.g. when a release revises past years
+source_cache_dir = '../cache'
+country_store_dir = '../country/store'
+
+
+def read_source(path, reader, **kwargs):
+    """Parse a source file once, then load its parquet copy, keyed by the file's hash and the reader and its
+    arguments, on later runs."""
+    source_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        source_hash.update(f.read())
+    source_hash.update(json.dumps([reader.__name__, kwargs], sort_keys=True, default=str).encode())
+    cache_path = os.path.join(source_cache_dir, f'{os.path.basename(path)}.{source_hash.hexdigest()[:16]}.parquet')
+    if os.path.exists(cache_path):
+        return pd.read_parquet(cache_path)
+
+    source_df = reader(path, **kwargs)
+    source_df.columns = source_df.columns.astype(str)
+    os.makedirs(source_cache_dir, exist_ok=True)
+    source_df.to_parquet(cache_path)
+    return source_df
+
+
+def get_country_emissions(data_dfs, years):
+    """CO2e (kt) of every country, year and subsector in the EDGAR frames, in one melt/map/groupby pass."""
+    year_columns = [f'Y_{year}' for year in years]
+    id_columns = ['Country_code_A3', 'ipcc_code_2006_for_standard_report', 'Substance']
+    emissions = pd.concat([data_df[id_columns + year_columns] for data_df in data_dfs], ignore_index=True)
+    emissions = emissions.melt(id_vars=id_columns, value_vars=year_columns, var_name='year', value_name='emissions')
+    emissions = emissions[emissions.emissions > 0]
+
+    subsectors = emissions['ipcc_code_2006_for_standard_report'].map(SECTOR_CONV)
+    gwp = emissions['Substance'].map(GWP_AR5)
+    unmapped = set(emissions['ipcc_code_2006_for_standard_report'][subsectors.isna()]) | \
+        set(emissions['Substance'][gwp.isna()])
+    if unmapped:
+        raise KeyError(f'No sector conversion or GWP for {sorted(unmapped)}')
+
+    emissions = pd.DataFrame({'country_code': emissions['Country_code_A3'],
+                              'year': emissions['year'].str[2:].astype(int),
+                              'subsector': subsectors,
+                              'emissions': gwp * emissions['emissions']})
+    country_emission_df = emissions.groupby(['country_code', 'year', 'subsector'])['emissions'].sum().unstack(
+        fill_value=0)
+    return country_emission_df.reindex(columns=list(dict.fromkeys(SECTOR_CONV.values())), fill_value=0)
+
 
 if create_WRL_emissions:
-    f_gases_df = pd.read_excel('../EDGAR/v70_FT2021_F-gases_1990-2021.xlsx', sheet_name='IPCC2006', skiprows=9)
-    co2_df = pd.read_excel('../EDGAR/CO2_1970_2021.xlsx', sheet_name='CO2_IPCC2006', skiprows=9)
-    ch4_df = pd.read_excel('../EDGAR/CH4_1970_2021.xlsx', sheet_name='CH4_IPCC2006', skiprows=9)
-    n2o_df = pd.read_excel('../EDGAR/N2O_1970_2021.xlsx', sheet_name='N2O_IPCC2006', skiprows=9)
-
-    WRL_df = pd.DataFrame()
-    WRL_df['year'] = None
-    WRL_df = WRL_df.set_index('year')
-    for sector in SECTOR_CONV:
-        WRL_df[SECTOR_CONV[sector]] = None
-
-    for year in range(2000, 2021 + 1):
-        print(year)
-        add = {}
-        for column in WRL_df.columns:
-            add[column] = 0
-        add['year'] = year
-
-        for data_df in [co2_df, ch4_df, n2o_df, f_gases_df]:
-            for idx, row in data_df.iterrows():
-                if row[f'Y_{year}'] > 0:
-                    add[SECTOR_CONV[row['ipcc_code_2006_for_standard_report']]] += GWP_AR5[row['Substance']] * row[f'Y_{year}']
-
-        df_add = pd.DataFrame.from_dict([add])
-        df_add = df_add.set_index('year')
-        WRL_df = pd.concat([WRL_df, df_add])
-    cols_with_all_zeros = [column for column in WRL_df.columns if WRL_df[column].sum() == 0]
-    WRL_df = WRL_df.drop(columns=cols_with_all_zeros)
-    WRL_df.to_csv('../WRL_emissions.csv')
-
-    print('WRL_emissions created')
+    data_dfs = [read_source('../EDGAR/CO2_1970_2021.xlsx', pd.read_excel, sheet_name='CO2_IPCC2006', skiprows=9),
+                read_source('../EDGAR/CH4_1970_2021.xlsx', pd.read_excel, sheet_name='CH4_IPCC2006', skiprows=9),
+                read_source('../EDGAR/N2O_1970_2021.xlsx', pd.read_excel, sheet_name='N2O_IPCC2006', skiprows=9),
+                read_source('../EDGAR/v70_FT2021_F-gases_1990-2021.xlsx', pd.read_excel, sheet_name='IPCC2006',
+                            skiprows=9)]
+    years = set.intersection(*[{int(column[2:]) for column in data_df.columns if column.startswith('Y_')}
+                               for data_df in data_dfs])
+    years = [year for year in sorted(years) if year >= 2000]
+
+    country_emission_df = None
+    if os.path.exists('../country_emissions.csv') and not rebuild:
+        country_emission_df = pd.read_csv('../country_emissions.csv', index_col=['country_code', 'year'])
+        years = [year for year in years if year not in set(country_emission_df.index.get_level_values('year'))]
+
+    if years:
+        country_emission_df = pd.concat([country_emission_df, get_country_emissions(data_dfs, years)])
+        country_emission_df = country_emission_df.fillna(0).sort_index()
+        country_emission_df.to_csv('../country_emissions.csv')
+
+        WRL_df = country_emission_df.groupby(level='year').sum()
+        WRL_df = WRL_df.loc[:, WRL_df.sum() != 0]
+        WRL_df.to_csv('../WRL_emissions.csv')
+
+    print(f'WRL_emissions and country_emissions created, {len(years)} new years')
+
+
+def get_country_data(emission_df, energy_df):
+    country_data = emission_df.copy()
+
+    for sector in SECTORS:
+        country_data[sector] = sum([country_data[subsector] for subsector in SECTORS[sector]
+                                    if subsector in country_data.columns])
+    country_data['all'] = sum([country_data[sector] for sector in SECTORS])
+    country_data = (country_data * 1000).add_suffix('_emissions')
+
+    electricity_df = energy_df[electricity_columns].reindex(country_data.index).fillna(0)
+    country_data = pd.concat([country_data, electricity_df], axis=1)
+    country_data['carbon_free_electricity'] = sum([country_data[f'{elec_type}_electricity']
+                                                   for elec_type in CARBON_FREE_TYPES])
+    return country_data
+
+
+def add_country_data(country_data, emission_df, energy_df):
+    """country_data (None to build from scratch) with rows added for the years it does not have yet. Years after the
+    last one OWID has electricity data for wait for a later refresh rather than being stored with zero electricity,
+    since rows are never revisited and the latest one is where simulations start."""
+    published = energy_df[electricity_columns].notna().any(axis=1)
+    if published.any():
+        emission_df = emission_df[emission_df.index <= published[published].index.max()]
+    if country_data is not None:
+        emission_df = emission_df[~emission_df.index.isin(country_data.index)]
+        if not len(emission_df):
+            return country_data
+    return pd.concat([country_data, get_country_data(emission_df, energy_df)]).fillna(0)
+
 
 WRL_emission_df = pd.read_csv('../WRL_emissions.csv', index_col='year')
-owid_energy_df = pd.read_csv('../owid/owid-energy-data.csv')
+owid_energy_df = read_source('../owid/owid-energy-data.csv', pd.read_csv)
 
 first_year = min(WRL_emission_df.index)
 last_year = max(WRL_emission_df.index)
 
-owid_energy_df = owid_energy_df[owid_energy_df.country == 'World']
 owid_energy_df = owid_energy_df[owid_energy_df.year >= first_year]
 owid_energy_df = owid_energy_df[owid_energy_df.year <= last_year]
-
-owid_energy_df = owid_energy_df.set_index('year')
 electricity_columns = [column for column in owid_energy_df.columns if 'electricity' in column]
 
-WRL_data = WRL_emission_df.copy()
-
-for sector in SECTORS:
-    WRL_data[sector] = sum([WRL_data[subsector] for subsector in SECTORS[sector] if subsector in WRL_data.columns])
-WRL_data['all'] = sum([WRL_data[sector] for sector in SECTORS])
-for column in WRL_data.columns:
-    WRL_data[column] = WRL_data[column] * 1000
-    WRL_data = WRL_data.rename({column: f'{column}_emissions'}, axis=1)
-
-for column in electricity_columns:
-    WRL_data[column] = owid_energy_df[column]
-WRL_data['carbon_free_electricity'] = sum([WRL_data[f'{elec_type}_electricity'] for elec_type in CARBON_FREE_TYPES])
+WRL_data = None
+if os.path.exists('../country/WRL_data.csv') and not rebuild:
+    WRL_data = pd.read_csv('../country/WRL_data.csv', index_col='year')
+WRL_data = add_country_data(WRL_data, WRL_emission_df,
+                            owid_energy_df[owid_energy_df.country == 'World'].set_index('year'))
 WRL_data.to_csv('../country/WRL_data.csv')
 
 print('WRL_data created')
+
+country_store = None
+if os.path.exists(os.path.join(country_store_dir, 'country_data.json')) and not rebuild:
+    country_store = CountryStore(country_store_dir)
+
+country_dfs = {'WRL': WRL_data}
+if os.path.exists('../country_emissions.csv'):
+    country_emission_df = pd.read_csv('../country_emissions.csv', index_col=['country_code', 'year'])
+    for country_code, emission_df in country_emission_df.groupby(level='country_code'):
+        if country_code in COUNTRY_CODES:
+            emission_df = emission_df.droplevel('country_code').fillna(0)
+            emission_df = emission_df.loc[:, (emission_df != 0).any()]
+            energy_df = owid_energy_df[owid_energy_df.country == COUNTRY_CODES[country_code]].set_index('year')
+            country_data = None
+            if country_store is not None and country_code in country_store:
+                country_data = country_store.get_country_df(country_code).set_index('year')
+            country_dfs[country_code] = add_country_data(country_data, emission_df, energy_df)
+write_country_store({country_code: country_df.reset_index() for country_code, country_df in country_dfs.items()},
+                    country_store_dir)
+
+print(f'Country store created with {len(country_dfs)} countries')
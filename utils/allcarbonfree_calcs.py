@@ -1,10 +1,22 @@
+import asyncio
+import copy
 import numpy as np
 import pandas as pd
 from datetime import datetime
 import pytz
-from paths.models import Country
 import json
 from utils.constants import *
+from utils import sim_engine
+from utils.path_engine import CleanTechParams, get_country_summary, get_energy_increments, get_summary, \
+    get_total_sim_emissions, get_trajectories
+from utils.country_baselines import get_country_baseline, get_annual, get_increase_energy_use_params
+from utils.path_results import get_path_key, path_results, PathResultCache
+from utils.result_format import encode_country_df_lite, encode_frame, encode_trajectories
+from utils.path_metrics import phase, record_path_metrics
+from utils.path_index import path_index
+
+
+resumable_paths = PathResultCache(RESUMABLE_PATH_CACHE_SIZE)
 
 
 class NumpyArrayEncoder(json.JSONEncoder):
@@ -14,271 +26,577 @@ class NumpyArrayEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
-def create_path(path, author=None, save_path=False, include_full=False, cleantech_output=None):
-    class CleanTechObj:
-        list = []
+CleanTechObj = CleanTechParams
+
+
+class Path:
+    def __init__(self, country_code, increase_energy_use=True, engine='dict', time_resolution='year'):
+        self.engine = engine
+        self.steps_per_year = sim_engine.get_steps_per_year(time_resolution)
+        self.cleantech_output = None
+        self.checkpoints = {}
+        self.years_simulated = 0
+        self.run_unit_counts = []
+        self.terminated = False
+        self.max_carbon_free_electricity = None
+        self.emissions_after_2010 = None
+        self.total_sim_emissions = None
+        self.inc_emission_params = None
+        self.output_delta = None
+        self.increase_energy_use = increase_energy_use
+        baseline = get_country_baseline(country_code)
+        self.baseline = baseline
+        self.starting_year = 2000
+        self.ending_year = 2100
+        self.country_df = baseline.country_df
+        self.country_df_init = baseline.country_df
+        self.subsectors = baseline.subsectors
+        self.sectors = baseline.sectors
+        self.annual = dict(baseline.annual)
+        self.annual_df = baseline.annual_df.copy()
+        self.latest_year = baseline.latest_year
+        self.fossil_list = []
+        self.non_fossil_list = []
+        self.cleantech_list = []
+        self.inc_emission_params = baseline.inc_emission_params
+
+    def set_increase_energy_use_params(self):
+        self.inc_emission_params = get_increase_energy_use_params(self.country_df, self.subsectors)
+
+    def set_fossil_list(self):
+        self.fossil_list = [tech_idx for tech_idx in self.cleantech_list if
+                            (tech_idx.electric_generation_type == 'fossil') or
+                            (tech_idx.electric_generation_type is None)]
+        self.non_fossil_list = [tech_idx for tech_idx in self.cleantech_list if
+                                (tech_idx.electric_generation_type != 'fossil') and
+                                (tech_idx.electric_generation_type is not None)]
+
+    def set_cleantech_subsectors(self):
+        subsector_sectors = self.baseline.layout.subsector_sectors
+        for tech_idx in self.cleantech_list:
+            if tech_idx.all_subsectors:
+                tech_idx.all_subsectors = [subsector_idx for subsector_idx in tech_idx.all_subsectors if
+                                           subsector_idx in self.subsectors]
+            tech_idx.sectors_changed = {subsector_sectors[subsector_idx] for subsector_idx in
+                                        (tech_idx.all_subsectors or []) + ['Electricity & heat'] if
+                                        subsector_idx in subsector_sectors}
+
+    def set_cleantech_list(self, cleantech_list):
+        self.cleantech_list = cleantech_list
+        self.set_cleantech_subsectors()
+        self.set_fossil_list()
+
+    def set_annual(self):
+        self.annual.update(get_annual(self.annual_df))
+
+    def set_annual_totals(self, sectors=None):
+        for sector_idx, subsectors in self.baseline.layout.sector_subsectors:
+            if (sectors is None) or (sector_idx in sectors):
+                self.annual[sector_idx] = sum([self.annual[ss_idx] for ss_idx in subsectors])
+
+        self.annual['all'] = sum([self.annual[sector_idx] for sector_idx in SECTORS])
+        self.annual['electricity'] = TWH_TO_KWH * LBS_TO_TONS * sum(
+            [self.annual[elec_type] * CO2_LBS_PER_KWH[elec_type]
+             for elec_type in FOSSIL_TYPES])
+        self.annual['carbon_free'] = sum([self.annual[elec_type] for elec_type in CARBON_FREE_TYPES])
+
+        self.annual['fossil'] = sum([self.annual[elec_type] for elec_type in FOSSIL_TYPES])
+
+    def sim_next_year(self, tech):
+        def calc_next_logistic_value():
+            delta_exp = tech.growth_rate * (tech.units_per_year[-1] - tech.units_per_year[-2])
+            if delta_exp > tech.max_prod:
+                tech.max_prod = delta_exp
+            all_units = tech.limit_perc * (tech.replace / tech.limiter_unit + tech.units_per_year[-1])
+            delta_log = max(tech.saturation_rate * (all_units - tech.units_per_year[-1]), 0)
+            return min(delta_log, tech.max_prod)
+
+        tech.calc_max_replace_units(self.annual)
+
+        if tech.replace > MAKE_ZERO and tech.start_year < self.annual['year']:
+            self.output_delta = calc_next_logistic_value()
+
+            if tech.all_subsectors:
+                emissions_sum = sum([self.annual[subsector_idx] for subsector_idx in tech.all_subsectors])
+                if tech.replace < self.output_delta * tech.CO2_reduced_per_unit:
+                    self.output_delta = tech.replace / tech.CO2_reduced_per_unit
+                if emissions_sum > 0:
+                    for subsector_idx in tech.all_subsectors:
+                        subsector_perc = self.annual[subsector_idx] / emissions_sum
+                        self.annual[subsector_idx] -= subsector_perc * self.output_delta * tech.CO2_reduced_per_unit
+                        if self.annual[subsector_idx] < MAKE_ZERO:
+                            self.annual[subsector_idx] = 0
+
+            tech.add_to_annual_output(tech.units_per_year[-1] + self.output_delta)
+
+            if (tech.electric_generation_type == 'fossil') or (tech.electric_generation_type is None):
+                if (tech.replace - self.output_delta * tech.limiter_unit) < MAKE_ZERO:
+                    self.output_delta = 0
+
+                for elec_type in FOSSIL_TYPES:
+                    if self.annual['fossil'] > 0:
+                        elec_type_perc = self.annual[elec_type] / self.annual['fossil']
+                    else:
+                        if elec_type == 'gas':
+                            elec_type_perc = 1
+                        else:
+                            elec_type_perc = 0
+                    self.annual[elec_type] += elec_type_perc * self.output_delta * tech.electric_energy_per_unit
+                    self.annual['Electricity & heat'] += CO2_LBS_PER_KWH[elec_type] * \
+                                                         tech.electric_energy_per_unit * \
+                                                         elec_type_perc * self.output_delta * TWH_TO_KWH * \
+                                                         LBS_TO_TONS
+            else:
+                self.annual[tech.electric_generation_type] += self.output_delta * tech.electric_energy_per_unit
 
-        def __init__(self, *initial_data, **kwargs):
-            self.replace = None
-            self.limiter_unit = None
-            self.list.append(self)
-            for dictionary in initial_data:
-                for key in dictionary:
-                    setattr(self, key, dictionary[key])
-            for key in kwargs:
-                setattr(self, key, kwargs[key])
+                if tech.replace_fossil and self.annual['fossil'] > 0:
+                    for elec_type in FOSSIL_TYPES:
+                        elec_type_perc = self.annual[elec_type] / self.annual['fossil']
+                        self.annual[elec_type] -= elec_type_perc * self.output_delta
+                        if self.annual[elec_type] < MAKE_ZERO:
+                            self.annual[elec_type] = 0
+                        if self.annual['Electricity & heat'] > 0:
+                            self.annual['Electricity & heat'] -= CO2_LBS_PER_KWH[elec_type] * elec_type_perc * \
+                                                                 self.output_delta * TWH_TO_KWH * LBS_TO_TONS
+                        if self.annual['Electricity & heat'] < MAKE_ZERO:
+                            self.annual['Electricity & heat'] = 0
+
+            self.set_annual_totals(tech.sectors_changed)
+
+    def add_annual_to_df(self):
+        for key in self.annual:
+            if (key in SECTORS) or (key in SUBSECTORS) or (key in ['electricity', 'all']):
+                self.annual_df[f'{key}_emissions'] = self.annual[key]
+            elif (key in CARBON_FREE_TYPES) or (key in FOSSIL_TYPES) or (key in ['carbon_free', 'fossil']):
+                self.annual_df[f'{key}_electricity'] = self.annual[key]
+        self.annual_df['year'] = self.annual['year']
+        self.country_df = pd.concat([self.country_df, self.annual_df])
+
+    def get_energy_increments(self, first_year):
+        if not self.increase_energy_use:
+            return None
+        if self.inc_emission_params is self.baseline.inc_emission_params:
+            increments = self.baseline.get_energy_increments(self.ending_year)
+        else:
+            increments = get_energy_increments(self.inc_emission_params, self.baseline.layout.subsectors,
+                                               self.latest_year, self.ending_year)
+        return increments[first_year - self.latest_year - 1:]
+
+    def add_increase_energy_use(self, increments):
+        for subsector_idx, increment in zip(self.baseline.layout.subsectors, increments):
+            self.annual[subsector_idx] += increment
+
+        self.set_annual_totals()
+
+    def set_starting_year(self, set_year):
+        self.starting_year = set_year
+        self.country_df = self.country_df[self.country_df.year >= self.starting_year]
+
+    def set_ending_year(self, set_year):
+        self.ending_year = set_year
+
+    def simulate(self):
+        self.reset_to_latest_year()
+        self.checkpoints = {}
+        self.set_run_unit_counts()
+        self.simulate_years(self.latest_year + 1)
+        if self.cleantech_output:
+            self.set_cleantech_annual_output()
+
+    def iter_simulate(self):
+        """simulate, yielding each year's sector emissions and carbon-free electricity as soon as it is simulated,
+        then a summary record with the calc_totals outputs."""
+        self.reset_to_latest_year()
+        self.checkpoints = {}
+        self.set_run_unit_counts()
+        for annual in self.iter_years(self.latest_year + 1):
+            yield get_year_record(annual)
+        if self.cleantech_output:
+            self.set_cleantech_annual_output()
+        self.calc_totals()
+        yield get_summary_outputs(self)
+
+    def simulate_years(self, first_year):
+        for _ in self.iter_years(first_year):
+            pass
+
+    def iter_years(self, first_year):
+        if self.engine == 'array' or self.steps_per_year > 1:
+            yield from self.iter_array_years(first_year)
+            return
+
+        increments = self.get_energy_increments(first_year)
+        for year_idx in range(first_year, self.ending_year + 1):
+            self.annual['year'] = year_idx
+
+            if increments is not None:
+                self.add_increase_energy_use(increments[year_idx - first_year])
+
+            for tech_idx in self.fossil_list:
+                self.sim_next_year(tech_idx)
+            for tech_idx in self.non_fossil_list:
+                self.sim_next_year(tech_idx)
+
+            self.add_annual_to_df()
+            self.add_checkpoint(dict(self.annual), {tech.sim_key: (len(tech.units_per_year), tech.max_prod)
+                                                     for tech in self.cleantech_list})
+            self.years_simulated += 1
+            self.terminated = self.annual['all'] < MAKE_ZERO
+            yield self.annual
+            if self.terminated:
+                break
+
+    def add_checkpoint(self, annual, tech_states):
+        self.checkpoints[annual['year']] = (annual, tech_states)
+
+    def get_resume_year(self, cleantech_list):
+        old_keys = [tech.sim_key for tech in self.fossil_list + self.non_fossil_list]
+        new_keys = [tech.sim_key for tech in cleantech_list if
+                    (tech.electric_generation_type == 'fossil') or (tech.electric_generation_type is None)] + \
+                   [tech.sim_key for tech in cleantech_list if
+                    (tech.electric_generation_type != 'fossil') and (tech.electric_generation_type is not None)]
+        changed = set(old_keys) ^ set(new_keys)
+        if [key for key in old_keys if key in new_keys] != [key for key in new_keys if key in old_keys]:
+            changed |= set(old_keys) & set(new_keys)
+
+        start_years = {tech.sim_key: tech.start_year for tech in self.cleantech_list + cleantech_list}
+        resume_year = max(self.checkpoints)
+        if changed:
+            resume_year = min(resume_year, min(start_years[key] for key in changed))
+        return resume_year
+
+    def resimulate(self, cleantech_list):
+        if not self.checkpoints or self.steps_per_year > 1:
+            self.set_cleantech_list(cleantech_list)
+            return self.simulate()
+
+        resume_year = self.get_resume_year(cleantech_list)
+        if resume_year not in self.checkpoints:
+            self.set_cleantech_list(cleantech_list)
+            return self.simulate()
+
+        annual, tech_states = self.checkpoints[resume_year]
+        old_techs = {tech.sim_key: tech for tech in self.cleantech_list}
+        self.set_cleantech_list(cleantech_list)
+        for tech in self.cleantech_list:
+            if tech.sim_key in old_techs and tech.sim_key in tech_states:
+                n_units, tech.max_prod = tech_states[tech.sim_key]
+                tech.units_per_year = list(old_techs[tech.sim_key].units_per_year[:n_units])
+        self.set_run_unit_counts()
+
+        self.checkpoints = {year_idx: self.checkpoints[year_idx] for year_idx in self.checkpoints if
+                            year_idx <= resume_year}
+        self.annual = dict(annual)
+        self.country_df = self.country_df[self.country_df.year <= resume_year]
+        self.terminated = self.annual['all'] < MAKE_ZERO
+        if not self.terminated:
+            self.simulate_years(resume_year + 1)
+        if self.cleantech_output:
+            self.set_cleantech_annual_output()
+
+    def set_run_unit_counts(self):
+        """Each CleanTech's units_per_year length before a simulate or resimulate run, for get_run_steps."""
+        self.run_unit_counts = [len(tech.units_per_year) for tech in self.cleantech_list]
+
+    def get_run_steps(self):
+        """Years in which each CleanTech added units during the last simulate or resimulate run."""
+        return {str(tech.id): len(tech.units_per_year) - n_units for tech, n_units in
+                zip(self.cleantech_list, self.run_unit_counts)}
+
+    def set_cleantech_annual_output(self):
+        for cleantech in self.cleantech_list:
+            if cleantech.id == self.cleantech_output:
+                self.cleantech_annual_output = json.dumps(np.round(cleantech.units_per_year),
+                                                          cls=NumpyArrayEncoder)
+                return
+
+    def get_cleantech_trajectories(self):
+        """path_engine.get_trajectories of every CleanTech, read once from the checkpoints."""
+        years = np.array(sorted(self.checkpoints), dtype=int)
+        unit_counts = np.array([[self.checkpoints[year_idx][1].get(tech.sim_key, (2, None))[0]
+                                 for tech in self.cleantech_list] for year_idx in years], dtype=int)
+        starts = ([self.baseline.annual] + [self.checkpoints[year_idx][0] for year_idx in years])[:len(years)]
+        fossil_electricity = [[annual[elec_type] for elec_type in FOSSIL_TYPES] for annual in starts]
+        return get_trajectories(self.cleantech_list, years, unit_counts.reshape(len(years), len(self.cleantech_list)),
+                                fossil_electricity)
+
+    def reset_to_latest_year(self):
+        self.country_df = self.country_df_init.copy()
+        self.annual_df = self.country_df[self.country_df.year == max(self.country_df.year.values)].copy()
+        self.set_annual()
+        self.terminated = False
+
+    def get_array_inputs(self, first_year=None):
+        if first_year is None:
+            first_year = self.latest_year + 1
+        years = np.arange(first_year, self.ending_year + 1)
+        return self.baseline.layout, years, self.get_energy_increments(first_year)
+
+    def set_array_state(self, layout, years, state):
+        n_years = len(state)
+        if not n_years:
+            return
+
+        self.annual.update(layout.annual_from_row(state[n_years - 1]))
+        self.annual['year'] = int(years[n_years - 1])
+
+        sim_df = self.annual_df.loc[self.annual_df.index.repeat(n_years)]
+        for column_idx, column in enumerate(layout.columns):
+            sim_df[column] = state[:, column_idx]
+        sim_df['year'] = years[:n_years]
+        self.country_df = pd.concat([self.country_df, sim_df])
+
+    def simulate_array(self, first_year=None):
+        for _ in self.iter_array_years(first_year):
+            pass
+
+    def iter_array_years(self, first_year=None):
+        layout, years, increments = self.get_array_inputs(first_year)
+        techs = self.fossil_list + self.non_fossil_list
+        state = np.empty((len(years), len(layout.keys)))
+        n_years = 0
+        if self.steps_per_year == 1:
+            rows = ((row, tech_state, row[layout.all] < MAKE_ZERO) for row, tech_state in
+                    sim_engine.iter_simulate_array(layout, layout.row_from_annual(self.annual), years, increments,
+                                                   techs))
+        else:
+            rows = sim_engine.iter_simulate_steps(layout, layout.row_from_annual(self.annual), years, increments, techs,
+                                                  self.steps_per_year)
+        try:
+            for row, tech_state, terminated in rows:
+                state[n_years] = row
+                annual = dict(self.annual)
+                annual.update(layout.annual_from_row(row))
+                annual['year'] = int(years[n_years])
+                self.add_checkpoint(annual, {tech.sim_key: (int(tech_state[tech_num, 0]), tech_state[tech_num, 1])
+                                             for tech_num, tech in enumerate(techs)})
+                n_years += 1
+                self.years_simulated += 1
+                self.terminated = bool(terminated)
+                yield annual
+        finally:
+            self.set_array_state(layout, years, state[:n_years])
+
+    def simulate_batch(self, cleantech_lists):
+        self.reset_to_latest_year()
+        layout, years, increments = self.get_array_inputs()
+
+        paths = []
+        for cleantech_list in cleantech_lists:
+            path = copy.copy(self)
+            path.annual = dict(self.annual)
+            path.set_cleantech_list(cleantech_list)
+            paths.append(path)
+
+        batch = sim_engine.TechBatch(layout, [path.fossil_list + path.non_fossil_list for path in paths])
+        history, n_years, units = sim_engine.simulate_batch(layout, layout.row_from_annual(self.annual), years,
+                                                            increments, batch)
+
+        for scenario_idx, path in enumerate(paths):
+            for slot_idx, tech in enumerate(path.fossil_list + path.non_fossil_list):
+                tech_units = units[:, scenario_idx, slot_idx]
+                tech.units_per_year = list(tech.units_per_year) + tech_units[~np.isnan(tech_units)].tolist()
+            path.set_array_state(layout, years, history[:n_years[scenario_idx], scenario_idx])
+            path.terminated = bool(n_years[scenario_idx]) and \
+                history[n_years[scenario_idx] - 1, scenario_idx, layout.all] < MAKE_ZERO
+        return paths
+
+    def calc_batch_totals(self, years, all_emissions, n_years):
+        """calc_totals and carbon_zero_year for the (years x scenarios) all_emissions of sim_engine.simulate_batch."""
+        simulated = np.arange(len(all_emissions))[:, None] < n_years[None, :]
+        all_emissions = np.where(simulated, all_emissions, 0.)
+        country_df = self.country_df_init
+        emissions_after_2010 = sum(country_df[country_df.year > 2010]['all_emissions'].values) + \
+            all_emissions[years[:len(all_emissions)] > 2010].sum(axis=0)
+        total_sim_emissions = get_total_sim_emissions(emissions_after_2010)
+        carbon_zero_year = years[n_years - 1] if len(years) else np.full(len(n_years), self.latest_year)
+        return total_sim_emissions, carbon_zero_year
+
+    def calc_totals(self):
+        self.emissions_after_2010 = sum(
+            self.country_df[self.country_df.year > 2010]['all_emissions'].values)
+        self.total_sim_emissions = get_total_sim_emissions(self.emissions_after_2010)
+        self.max_carbon_free_electricity = max(self.country_df.carbon_free_electricity) * TWH_TO_GW
+
+
+def get_cleantechs(path):
+    cleantechs = path.cleantech_list.all()
+    path.cleantech_ids = str(sorted([str(cleantech.id) for cleantech in cleantechs]))
+    return cleantechs
 
-            if self.all_subsectors:
-                self.all_subsectors = json.loads(self.all_subsectors)
-                self.all_subsectors = flatten(self.all_subsectors)
 
-            self.units_per_year = [self.before_start_year_units, self.start_year_units]
-            if self.units_per_year:
-                self.max_prod = self.units_per_year[-2] - self.units_per_year[-1]
+def get_year_record(annual):
+    record = {'year': int(annual['year']), 'carbon_free_electricity': float(annual['carbon_free'])}
+    record.update({f'{sector_idx}_emissions': float(annual[sector_idx]) for sector_idx in SECTORS})
+    return record
 
-            if self.replace_fossil:  # Clean Energy Source
-                self.limiter_unit = self.electric_energy_per_unit
-            else:  # Reduce/Replace Carbon Emissions
-                self.limiter_unit = self.CO2_reduced_per_unit
 
-        def add_to_annual_output(self, output):
-            self.units_per_year = np.append(self.units_per_year, output)
+def get_summary_outputs(all_carbon_free):
+    """get_summary of a calc_totals Path; get_country_summary for countries other than WRL."""
+    if all_carbon_free.baseline.country_code != 'WRL':
+        return get_country_summary(all_carbon_free.emissions_after_2010, all_carbon_free.max_carbon_free_electricity,
+                                   all_carbon_free.annual['year'])
+    return get_summary(all_carbon_free.total_sim_emissions, all_carbon_free.max_carbon_free_electricity,
+                       all_carbon_free.annual['year'])
 
-        def calc_max_replace_units(self, annual):
-            if self.replace_fossil:
-                self.replace = annual['fossil']
-            else:
-                self.replace = sum([annual[subsector] for subsector in self.all_subsectors])
-
-    class Path:
-        def __init__(self, country_code, increase_energy_use=True):
-            self.max_carbon_free_electricity = None
-            self.total_sim_emissions = None
-            self.inc_emission_params = None
-            self.output_delta = None
-            self.increase_energy_use = increase_energy_use
-            self.country_df = pd.read_json(Country.objects.filter(country_code=country_code).first().country_df,
-                                           orient='split')
-            self.starting_year = 2000
-            self.ending_year = 2100
-            self.country_df = self.country_df[self.country_df.year >= self.starting_year]
-            self.country_df_init = self.country_df.copy()
-            self.subsectors = [ss_idx for ss_idx in SUBSECTORS if f'{ss_idx}_emissions' in self.country_df.columns]
-            self.sectors = [sector_idx for sector_idx in SECTORS if
-                            f'{sector_idx}_emissions' in self.country_df.columns]
-            self.annual = {}
-            self.annual_df = self.country_df[self.country_df.year == max(self.country_df.year.values)].copy()
-            self.set_annual()
-            self.latest_year = max(self.country_df.year.values)
-            self.fossil_list = []
-            self.non_fossil_list = []
-            self.cleantech_list = []
-            self.set_increase_energy_use_params()
-
-        def set_increase_energy_use_params(self):
-            def get_best_fit_log(subsector_idx, years_back=10):
-                years = self.country_df['year'].tail(n=years_back).values
-                values = self.country_df[subsector_idx + '_emissions'].tail(n=years_back).values
-                params = np.polyfit(np.log(years - min(years) + 1), values - min(values), 1)
-                return np.append(params, years_back)
-
-            self.inc_emission_params = {subsector_idx: get_best_fit_log(subsector_idx) for subsector_idx in
-                                        self.subsectors}
-
-        def set_fossil_list(self):
-            self.fossil_list = [tech_idx for tech_idx in self.cleantech_list if
-                                (tech_idx.electric_generation_type == 'fossil') or
-                                (tech_idx.electric_generation_type is None)]
-            self.non_fossil_list = [tech_idx for tech_idx in self.cleantech_list if
-                                    (tech_idx.electric_generation_type != 'fossil') and
-                                    (tech_idx.electric_generation_type is not None)]
-
-        def set_cleantech_subsectors(self):
-            for tech_idx in self.cleantech_list:
-                if tech_idx.all_subsectors:
-                    tech_idx.all_subsectors = [subsector_idx for subsector_idx in tech_idx.all_subsectors if
-                                               subsector_idx in self.subsectors]
-
-        def set_cleantech_list(self, cleantech_list):
-            self.cleantech_list = cleantech_list
-            self.set_cleantech_subsectors()
-            self.set_fossil_list()
-
-        def set_annual(self):
-            for column in self.annual_df.columns:
-                if column[-9:] == 'emissions':
-                    column_pre = column[:-10]
-                    if (column_pre in SECTORS) or (column_pre in SUBSECTORS) or (column_pre in ['electricity', 'all']):
-                        self.annual.update({column_pre: self.annual_df[column].values[0]})
-                elif column[-11:] == 'electricity':
-                    self.annual.update({column[:-12]: self.annual_df[column].values[0]})
-                else:
-                    self.annual.update({column: self.annual_df[column].values[0]})
-
-        def set_annual_totals(self):
-            for sector_idx in SECTORS:
-                self.annual[sector_idx] = sum([
-                    self.annual[ss_idx] for ss_idx in SECTORS[sector_idx] if ss_idx in self.subsectors])
-
-            self.annual['all'] = sum([self.annual[sector_idx] for sector_idx in SECTORS])
-            self.annual['electricity'] = TWH_TO_KWH * LBS_TO_TONS * sum(
-                [self.annual[elec_type] * CO2_LBS_PER_KWH[elec_type]
-                 for elec_type in FOSSIL_TYPES])
-            self.annual['carbon_free'] = sum([self.annual[elec_type] for elec_type in CARBON_FREE_TYPES])
-
-            self.annual['fossil'] = sum([self.annual[elec_type] for elec_type in FOSSIL_TYPES])
-
-        def sim_next_year(self, tech):
-            def calc_next_logistic_value():
-                delta_exp = tech.growth_rate * (tech.units_per_year[-1] - tech.units_per_year[-2])
-                if delta_exp > tech.max_prod:
-                    tech.max_prod = delta_exp
-                all_units = tech.limit_perc * (tech.replace / tech.limiter_unit + tech.units_per_year[-1])
-                delta_log = max(tech.saturation_rate * (all_units - tech.units_per_year[-1]), 0)
-                return min(delta_log, tech.max_prod)
-
-            tech.calc_max_replace_units(self.annual)
-
-            if tech.replace > MAKE_ZERO and tech.start_year < self.annual['year']:
-                self.output_delta = calc_next_logistic_value()
-
-                if tech.all_subsectors:
-                    emissions_sum = sum([self.annual[subsector_idx] for subsector_idx in tech.all_subsectors])
-                    if tech.replace < self.output_delta * tech.CO2_reduced_per_unit:
-                        self.output_delta = tech.replace / tech.CO2_reduced_per_unit
-                    if emissions_sum > 0:
-                        for subsector_idx in tech.all_subsectors:
-                            subsector_perc = self.annual[subsector_idx] / emissions_sum
-                            self.annual[subsector_idx] -= subsector_perc * self.output_delta * tech.CO2_reduced_per_unit
-                            if self.annual[subsector_idx] < MAKE_ZERO:
-                                self.annual[subsector_idx] = 0
-
-                tech.add_to_annual_output(tech.units_per_year[-1] + self.output_delta)
-
-                if (tech.electric_generation_type == 'fossil') or (tech.electric_generation_type is None):
-                    if (tech.replace - self.output_delta * tech.limiter_unit) < MAKE_ZERO:
-                        self.output_delta = 0
 
-                    for elec_type in FOSSIL_TYPES:
-                        if self.annual['fossil'] > 0:
-                            elec_type_perc = self.annual[elec_type] / self.annual['fossil']
-                        else:
-                            if elec_type == 'gas':
-                                elec_type_perc = 1
-                            else:
-                                elec_type_perc = 0
-                        self.annual[elec_type] += elec_type_perc * self.output_delta * tech.electric_energy_per_unit
-                        self.annual['Electricity & heat'] += CO2_LBS_PER_KWH[elec_type] * \
-                                                             tech.electric_energy_per_unit * \
-                                                             elec_type_perc * self.output_delta * TWH_TO_KWH * \
-                                                             LBS_TO_TONS
-                else:
-                    self.annual[tech.electric_generation_type] += self.output_delta * tech.electric_energy_per_unit
-
-                    if tech.replace_fossil and self.annual['fossil'] > 0:
-                        for elec_type in FOSSIL_TYPES:
-                            elec_type_perc = self.annual[elec_type] / self.annual['fossil']
-                            self.annual[elec_type] -= elec_type_perc * self.output_delta
-                            if self.annual[elec_type] < MAKE_ZERO:
-                                self.annual[elec_type] = 0
-                            if self.annual['Electricity & heat'] > 0:
-                                self.annual['Electricity & heat'] -= CO2_LBS_PER_KWH[elec_type] * elec_type_perc * \
-                                                                     self.output_delta * TWH_TO_KWH * LBS_TO_TONS
-                            if self.annual['Electricity & heat'] < MAKE_ZERO:
-                                self.annual['Electricity & heat'] = 0
-
-                self.set_annual_totals()
-
-        def add_annual_to_df(self):
-            for key in self.annual:
-                if (key in SECTORS) or (key in SUBSECTORS) or (key in ['electricity', 'all']):
-                    self.annual_df[f'{key}_emissions'] = self.annual[key]
-                elif (key in CARBON_FREE_TYPES) or (key in FOSSIL_TYPES) or (key in ['carbon_free', 'fossil']):
-                    self.annual_df[f'{key}_electricity'] = self.annual[key]
-            self.annual_df['year'] = self.annual['year']
-            self.country_df = pd.concat([self.country_df, self.annual_df])
-
-        def add_increase_energy_use(self):
-            def get_emissions_increase(ss_idx):
-                params = self.inc_emission_params[ss_idx]
-                last_year = params[1] + params[0] * np.log(self.annual['year'] - self.latest_year + params[2])
-                this_year = params[1] + params[0] * np.log(self.annual['year'] - self.latest_year + 1 + params[2])
-                return this_year - last_year
-
-            for subsector_idx in self.subsectors:
-                self.annual[subsector_idx] += get_emissions_increase(subsector_idx)
-
-            self.set_annual_totals()
-
-        def set_starting_year(self, set_year):
-            self.starting_year = set_year
-            self.country_df = self.country_df[self.country_df.year >= self.starting_year]
-
-        def set_ending_year(self, set_year):
-            self.ending_year = set_year
-
-        def simulate(self):
-            self.country_df = self.country_df_init.copy()
-            self.annual_df = self.country_df[self.country_df.year == max(self.country_df.year.values)].copy()
-            self.set_annual()
-            for year_idx in range(self.latest_year + 1, self.ending_year + 1):
-                self.annual['year'] = year_idx
-
-                self.add_increase_energy_use()
-
-                for tech_idx in self.fossil_list:
-                    self.sim_next_year(tech_idx)
-                for tech_idx in self.non_fossil_list:
-                    self.sim_next_year(tech_idx)
-
-                self.add_annual_to_df()
-                if cleantech_output:
-                    for cleantech in self.cleantech_list:
-                        if cleantech.id == cleantech_output:
-                            self.cleantech_annual_output = json.dumps(np.round(cleantech.units_per_year),
-                                                                      cls=NumpyArrayEncoder)
-                if self.annual['all'] < MAKE_ZERO:
-                    break
-
-        def calc_totals(self):
-            emissions_2010 = 1930 * 1e9  # https://www.ipcc.ch/sr15/chapter/chapter-2/2-2/2-2-2/2-2-2-1/figure-2-3/
-            emissions_after_2010 = sum(
-                self.country_df[self.country_df.year > 2010]['all_emissions'].values)
-            self.total_sim_emissions = (emissions_2010 + emissions_after_2010) * 1e-9
-            self.max_carbon_free_electricity = max(self.country_df.carbon_free_electricity) * TWH_TO_GW
-
-    cleantechs = path.cleantech_list.all()
-    cleantech_ids = str(sorted([str(cleantech.id) for cleantech in cleantechs]))
+def get_path_outputs(all_carbon_free, include_full=False, cleantech_output=None, result_format='json'):
+    country_df_lite = all_carbon_free.country_df[COUNTRY_DF_LITE_COLUMNS]
+    country_df_lite.set_index('year', inplace=True)
+    outputs = {'country_df': encode_country_df_lite(country_df_lite, result_format)}
+    outputs.update(get_summary_outputs(all_carbon_free))
 
-    path.cleantech_ids = cleantech_ids
+    if include_full and result_format == 'binary':
+        outputs['country_df_full'] = encode_frame(all_carbon_free.country_df, 'float32')
+    elif include_full:
+        outputs['country_df_full'] = all_carbon_free.country_df.to_json(orient='split')
+    if cleantech_output:
+        outputs['cleantech_annual_output'] = all_carbon_free.cleantech_annual_output
+        outputs['cleantech_trajectories'] = encode_trajectories(all_carbon_free.get_cleantech_trajectories(),
+                                                                result_format)
+    return outputs
 
-    all_carbon_free = Path('WRL')
-    all_carbon_free.set_starting_year(path.starting_year)
 
-    for cleantech in cleantechs:
-        CleanTechObj(**cleantech.__dict__)
+def check_saved_country(country_code):
+    """Saved Paths and path_index hold the world-only total_sim_emissions and est_degree_rise, which
+    get_summary_outputs leaves out for other countries."""
+    if country_code != 'WRL':
+        raise ValueError(f'Only WRL Paths can be saved, not {country_code}')
 
-    all_carbon_free.set_cleantech_list(CleanTechObj.list)
-    all_carbon_free.simulate()
-    all_carbon_free.calc_totals()
 
-    country_df_lite = all_carbon_free.country_df[['year', 'carbon_free_electricity', 'Buildings_emissions',
-                                                  'Industry_emissions', 'AFOLU_emissions', 'Transport_emissions',
-                                                  'Energy systems_emissions']]
-    country_df_lite.set_index('year', inplace=True)
-    path.country_df = country_df_lite.to_json(orient='split', double_precision=0)
-
-    if include_full:
-        path.country_df_full = all_carbon_free.country_df.to_json(orient='split')
-    path.total_sim_emissions = int(all_carbon_free.total_sim_emissions)
-    path.max_carbon_free_electricity = int(all_carbon_free.max_carbon_free_electricity)
-    path.est_degree_rise = round(all_carbon_free.total_sim_emissions * .00055 - 0.05, 1)
-    path.carbon_zero_year = all_carbon_free.annual['year']
+def set_path_outputs(path, outputs, author=None, save_path=False):
+    for key in outputs:
+        setattr(path, key, outputs[key])
     path.time = pytz.utc.localize(datetime.now())
-    if cleantech_output:
-        path.cleantech_annual_output = all_carbon_free.cleantech_annual_output
     path.author = author
     if author == 'allcarbonfree':
         path.include_with_profile = True
     if save_path:
         path.save()
+
+
+def save_path_outputs(path, outputs, cleantech_ids=None, author=None, save_path=False, index_path=None):
+    """set_path_outputs, and keep path_index in step with saved Paths. index_path defaults to save_path; callers that
+    save in bulk themselves pass save_path=False, index_path=True. cleantech_ids are read from the Path if None."""
+    set_path_outputs(path, outputs, author, save_path)
+    if save_path if index_path is None else index_path:
+        if cleantech_ids is None:
+            cleantech_ids = [cleantech.id for cleantech in path.cleantech_list.all()]
+        path_index.update(path.pk, outputs, cleantech_ids)
+
+
+def get_cached_outputs(cleantechs, starting_year, country_code='WRL', result_format='json', time_resolution='year'):
+    key = get_path_key(cleantechs, starting_year, get_country_baseline(country_code).data_hash)
+    if result_format != 'json':
+        key = f'{key}.{result_format}'
+    if time_resolution != 'year':
+        key = f'{key}.{time_resolution}'
+    return key, path_results.get(key)
+
+
+def set_simulation_metrics(metrics, all_carbon_free, years_simulated, outputs):
+    metrics.set('years_simulated', years_simulated)
+    metrics.set('cleantech_steps', all_carbon_free.get_run_steps())
+    metrics.set('early_termination_year', int(all_carbon_free.annual['year']) if all_carbon_free.terminated else None)
+    metrics.set('output_size', {key: len(value) for key, value in outputs.items() if isinstance(value, str)})
+
+
+def create_path(path, author=None, save_path=False, include_full=False, cleantech_output=None, engine='dict',
+                use_cache=True, country_code='WRL', result_format='json', time_resolution='year'):
+    if save_path:
+        check_saved_country(country_code)
+    with record_path_metrics(country_code=country_code, engine=engine, time_resolution=time_resolution) as metrics:
+        cleantechs = get_cleantechs(path)
+        use_cache = use_cache and not include_full and not cleantech_output
+        outputs = None
+        with phase('baseline'):
+            data_hash = get_country_baseline(country_code).data_hash
+        if use_cache:
+            with phase('cache_lookup'):
+                key, outputs = get_cached_outputs(cleantechs, path.starting_year, country_code, result_format,
+                                                  time_resolution)
+        if metrics is not None:
+            metrics.set('cache_hit', outputs is not None)
+
+        if outputs is None:
+            cleantech_list = [CleanTechObj(**cleantech.__dict__) for cleantech in cleantechs]
+            sim_key = (getattr(path, 'pk', None), engine, data_hash, time_resolution)
+            all_carbon_free = resumable_paths.pop(sim_key) if sim_key[0] is not None else None
+            with phase('simulate'):
+                if all_carbon_free is None:
+                    all_carbon_free = Path(country_code, engine=engine, time_resolution=time_resolution)
+                    all_carbon_free.set_starting_year(path.starting_year)
+                    all_carbon_free.cleantech_output = cleantech_output
+                    all_carbon_free.set_cleantech_list(cleantech_list)
+                    years_simulated = all_carbon_free.years_simulated
+                    all_carbon_free.simulate()
+                else:
+                    all_carbon_free.cleantech_output = cleantech_output
+                    years_simulated = all_carbon_free.years_simulated
+                    all_carbon_free.resimulate(cleantech_list)
+            with phase('calc_totals'):
+                all_carbon_free.calc_totals()
+
+            with phase('outputs'):
+                outputs = get_path_outputs(all_carbon_free, include_full, cleantech_output, result_format)
+            if use_cache:
+                path_results.set(key, outputs)
+            if sim_key[0] is not None:
+                resumable_paths.set(sim_key, all_carbon_free)
+            if metrics is not None:
+                set_simulation_metrics(metrics, all_carbon_free, all_carbon_free.years_simulated - years_simulated,
+                                       outputs)
+
+        with phase('save' if save_path else 'set_outputs'):
+            save_path_outputs(path, outputs, [cleantech.id for cleantech in cleantechs], author, save_path)
+    return outputs
+
+
+def create_paths(paths, author=None, save_path=False, include_full=False, use_cache=True, country_code='WRL',
+                 result_format='json'):
+    if save_path:
+        check_saved_country(country_code)
+    use_cache = use_cache and not include_full
+    path_outputs = {}
+    cleantech_ids = {}
+    sim_paths = []
+    for path in paths:
+        cleantechs = get_cleantechs(path)
+        cleantech_ids[id(path)] = [cleantech.id for cleantech in cleantechs]
+        key, outputs = get_cached_outputs(cleantechs, path.starting_year, country_code, result_format) \
+            if use_cache else (None, None)
+        path_outputs[id(path)] = outputs
+        if outputs is None:
+            sim_paths.append((path, key, [CleanTechObj(**cleantech.__dict__) for cleantech in cleantechs]))
+
+    if sim_paths:
+        all_carbon_free = Path(country_code, engine='array')
+        path_sims = all_carbon_free.simulate_batch([cleantech_list for _, _, cleantech_list in sim_paths])
+        for (path, key, _), path_sim in zip(sim_paths, path_sims):
+            path_sim.calc_totals()
+            path_outputs[id(path)] = get_path_outputs(path_sim, include_full, result_format=result_format)
+            if use_cache:
+                path_results.set(key, path_outputs[id(path)])
+
+    for path in paths:
+        save_path_outputs(path, path_outputs[id(path)], cleantech_ids[id(path)], author, save_path)
+
+
+def stream_path(path, engine='array', country_code='WRL'):
+    """Path.iter_simulate records for a saved Path, for progressive rendering."""
+    all_carbon_free = Path(country_code, engine=engine)
+    all_carbon_free.set_starting_year(path.starting_year)
+    all_carbon_free.set_cleantech_list([CleanTechObj(**cleantech.__dict__) for cleantech in get_cleantechs(path)])
+    yield from all_carbon_free.iter_simulate()
+
+
+async def astream_path(path, engine='array', country_code='WRL'):
+    """stream_path as an async iterator; each year is simulated in the default executor."""
+    loop = asyncio.get_running_loop()
+    records = stream_path(path, engine, country_code)
+    done = object()
+    while True:
+        record = await loop.run_in_executor(None, next, records, done)
+        if record is done:
+            return
+        yield record
@@ -0,0 +1,101 @@
+import argparse
+import functools
+import multiprocessing
+import time
+
+if __name__ == '__main__':
+    import django
+    django.setup()
+
+from django.db import connections
+from paths.models import Path as PathModel
+from utils.constants import *
+from utils.country_baselines import get_country_baseline
+from utils.allcarbonfree_calcs import check_saved_country, get_cleantechs, save_path_outputs
+from utils.recompute_worker import init_worker, simulate_chunk
+
+RECOMPUTE_FIELDS = ['country_df', 'total_sim_emissions', 'max_carbon_free_electricity', 'est_degree_rise',
+                    'carbon_zero_year', 'time', 'cleantech_ids']
+
+
+def get_affected_paths(cleantech_ids=None):
+    paths = PathModel.objects.all()
+    if cleantech_ids:
+        paths = paths.filter(cleantech_list__id__in=cleantech_ids).distinct()
+    return paths.prefetch_related('cleantech_list')
+
+
+def get_path_job(path):
+    cleantechs = get_cleantechs(path)
+    return path.pk, [{key: value for key, value in cleantech.__dict__.items() if not key.startswith('_')}
+                     for cleantech in cleantechs]
+
+
+def recompute_paths(paths, processes=None, chunk_size=RECOMPUTE_CHUNK_SIZE, batch_size=RECOMPUTE_SAVE_BATCH_SIZE,
+                    progress=None, country_code='WRL'):
+    check_saved_country(country_code)
+    start_time = time.perf_counter()
+    paths = {path.pk: path for path in paths}
+    jobs = [get_path_job(path) for path in paths.values()]
+    cleantech_ids = {pk: [cleantech['id'] for cleantech in cleantechs] for pk, cleantechs in jobs}
+    chunks = [jobs[idx:idx + chunk_size] for idx in range(0, len(jobs), chunk_size)]
+
+    baseline = get_country_baseline(country_code).engine_baseline
+    pending = []
+    done = 0
+
+    def save_pending():
+        if pending:
+            type(pending[0]).objects.bulk_update(pending, RECOMPUTE_FIELDS, batch_size=batch_size)
+            pending.clear()
+
+    def add_results(results):
+        nonlocal done
+        for pk, outputs in results:
+            path = paths[pk]
+            save_path_outputs(path, outputs, cleantech_ids[pk], path.author, index_path=True)
+            pending.append(path)
+        done += len(results)
+        if len(pending) >= batch_size:
+            save_pending()
+        if progress:
+            elapsed = time.perf_counter() - start_time
+            progress(done, len(jobs), elapsed, done / elapsed if elapsed else 0)
+
+    if processes == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            add_results(simulate_chunk(chunk, country_code, baseline))
+    else:
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with multiprocessing.Pool(processes, initializer=init_worker,
+                                  initargs=(baseline.columns, baseline.values)) as pool:
+            for results in pool.imap_unordered(functools.partial(simulate_chunk, country_code=country_code), chunks):
+                add_results(results)
+    save_pending()
+
+    elapsed = time.perf_counter() - start_time
+    return {'paths': done, 'seconds': elapsed, 'paths_per_second': done / elapsed if elapsed else 0}
+
+
+def print_progress(done, total, elapsed, paths_per_second):
+    print(f'{done}/{total} paths, {elapsed:.1f} s, {paths_per_second:.1f} paths/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute saved Paths after a CleanTech or country data change.')
+    parser.add_argument('--cleantech', type=int, action='append',
+                        help='CleanTech id (repeatable); all Paths if omitted, e.g. after WRL_data.csv changes')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=RECOMPUTE_CHUNK_SIZE)
+    parser.add_argument('--batch-size', type=int, default=RECOMPUTE_SAVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    summary = recompute_paths(get_affected_paths(args.cleantech), args.processes, args.chunk_size, args.batch_size,
+                              progress=print_progress)
+    print(f"Recomputed {summary['paths']} paths in {summary['seconds']:.1f} s "
+          f"({summary['paths_per_second']:.1f} paths/s)")
+
+
+if __name__ == '__main__':
+    main()
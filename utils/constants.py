@@ -1,6 +1,7 @@
 COAL_CO2_LBS_PER_KWH = 2.23  # https://www.eia.gov/tools/faqs/faq.php?id=74&t=11
 GAS_CO2_LBS_PER_KWH = 0.91
 OIL_CO2_LBS_PER_KWH = 2.13
+EMISSIONS_TO_2010 = 1930 * 1e9  # https://www.ipcc.ch/sr15/chapter/chapter-2/2-2/2-2-2/2-2-2-1/figure-2-3/
 
 CO2_LBS_PER_KWH = {'coal': COAL_CO2_LBS_PER_KWH, 'gas': GAS_CO2_LBS_PER_KWH, 'oil': OIL_CO2_LBS_PER_KWH}
 CARBON_FREE_TYPES = ['hydro', 'nuclear', 'solar', 'wind', 'other_renewable']
@@ -14,6 +15,42 @@ USER_PATH_LIMIT = 5
 USER_CLEANTECH_LIMIT = 50
 CLEANTECH_REFERENCE_LIMIT = 10
 
+COUNTRY_BASELINE_CACHE_SIZE = 32
+COUNTRY_BASELINE_TTL = 60  # seconds before a cached baseline is checked against its Country row again
+PATH_RESULT_CACHE_SIZE = 1024
+RESUMABLE_PATH_CACHE_SIZE = 64
+RECOMPUTE_CHUNK_SIZE = 32
+RECOMPUTE_SAVE_BATCH_SIZE = 200
+COUNTRY_PATHS_CHUNK_SIZE = 4
+PATH_QUEUE_WORKERS = 4
+
+MONTE_CARLO_DRAWS = 1000
+MONTE_CARLO_PERCENTILES = [5, 25, 50, 75, 95]
+MONTE_CARLO_SPREAD = {'growth_rate': 0.05, 'saturation_rate': 0.2, 'limit_perc': 0.1, 'CO2_reduced_per_unit': 0.1}
+
+GOAL_SEEK_BOUNDS = {'growth_rate': (0, None), 'start_year_units': (0, None), 'limit_perc': (0, 1)}
+GOAL_SEEK_TOLERANCE = 1e-3
+GOAL_SEEK_MAX_PROBES = 60
+
+RESPONSE_SURFACE_POINTS = 9
+RESPONSE_SURFACE_SPANS = {'growth_rate': (0.5, 2.), 'saturation_rate': (0.25, 4.), 'limit_perc': (0.25, 4.)}
+RESPONSE_SURFACE_BATCH_SIZE = 256
+RESPONSE_SURFACE_CACHE_SIZE = 256
+
+PATH_INDEX_FIELDS = {'carbon_zero_year': 'int16', 'est_degree_rise': 'float64', 'total_sim_emissions': 'float64'}
+PATH_INDEX_CURVE_YEARS = list(range(2020, 2101, 10))
+PATH_INDEX_TTL = 60  # seconds before path_index picks up Paths saved or deleted by other processes
+
+TIME_RESOLUTIONS = {'year': 1, 'quarter': 4, 'month': 12}
+
+RESULT_FORMAT_PREFIX = 'acf1:'
+COUNTRY_DF_LITE_COLUMNS = ['year', 'carbon_free_electricity', 'Buildings_emissions', 'Industry_emissions',
+                           'AFOLU_emissions', 'Transport_emissions', 'Energy systems_emissions']
+RESULT_FORMAT_ENCODINGS = ['delta', 'float32']
+CLEANTECH_SIM_FIELDS = ['id', 'start_year', 'before_start_year_units', 'start_year_units', 'growth_rate',
+                        'saturation_rate', 'limit_perc', 'CO2_reduced_per_unit', 'electric_energy_per_unit',
+                        'replace_fossil', 'electric_generation_type', 'all_subsectors']
+
 KWH_PER_TON = 2000  # https://www.wri.org/insights/direct-air-capture-resource-considerations-and-costs-carbon-removal
 
 TON_TO_MTON = 1e-6
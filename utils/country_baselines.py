@@ -0,0 +1,150 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+from django.db.models.signals import post_save
+from paths.models import Country
+from utils.constants import *
+from utils.path_engine import EngineBaseline, fit_energy_use_params
+from utils.path_metrics import phase
+
+country_data_versions = {}
+country_store = None
+_baselines = OrderedDict()
+_baselines_lock = threading.Lock()
+
+
+def get_annual(annual_df):
+    annual = {}
+    for column in annual_df.columns:
+        if column[-9:] == 'emissions':
+            column_pre = column[:-10]
+            if (column_pre in SECTORS) or (column_pre in SUBSECTORS) or (column_pre in ['electricity', 'all']):
+                annual.update({column_pre: annual_df[column].values[0]})
+        elif column[-11:] == 'electricity':
+            annual.update({column[:-12]: annual_df[column].values[0]})
+        else:
+            annual.update({column: annual_df[column].values[0]})
+    return annual
+
+
+def get_increase_energy_use_params(country_df, subsectors):
+    return fit_energy_use_params(country_df['year'].values,
+                                 country_df[[f'{ss_idx}_emissions' for ss_idx in subsectors]].values, subsectors)
+
+
+class CountryBaseline:
+    def __init__(self, country_code, country_df, data_version=0, starting_year=2000, data_hash=None,
+                 from_db=False):
+        self.country_code = country_code
+        self.data_version = data_version
+        self.from_db = from_db
+        self.checked_time = time.monotonic()
+        if data_hash is None:
+            data_hash = hashlib.sha256(country_df.to_json(orient='split').encode()).hexdigest()
+        self.data_hash = data_hash
+        self.country_df = country_df[country_df.year >= starting_year]
+        self.subsectors = [ss_idx for ss_idx in SUBSECTORS if f'{ss_idx}_emissions' in self.country_df.columns]
+        self.sectors = [sector_idx for sector_idx in SECTORS if f'{sector_idx}_emissions' in self.country_df.columns]
+        self.latest_year = max(self.country_df.year.values)
+        self.annual_df = self.country_df[self.country_df.year == self.latest_year].copy()
+        self.annual = get_annual(self.annual_df)
+        with phase('energy_fit'):
+            self.engine_baseline = EngineBaseline(self.country_df.columns, self.country_df.values)
+        self.inc_emission_params = self.engine_baseline.inc_emission_params
+        self.layout = self.engine_baseline.layout
+
+    def get_energy_increments(self, ending_year):
+        return self.engine_baseline.get_energy_increments(ending_year)
+
+    @classmethod
+    def from_json(cls, country_code, country_json, data_version=0, from_db=True):
+        with phase('read_json'):
+            country_df = pd.read_json(country_json, orient='split')
+        return cls(country_code, country_df, data_version, data_hash=get_json_hash(country_json), from_db=from_db)
+
+    @classmethod
+    def from_db(cls, country_code, data_version=0):
+        return cls.from_json(country_code, get_country_json(country_code), data_version)
+
+    @classmethod
+    def from_store(cls, country_code, store, data_version=0):
+        with phase('store_read'):
+            country_df = store.get_country_df(country_code)
+            data_hash = store.get_data_hash(country_code)
+        return cls(country_code, country_df, data_version, data_hash=data_hash)
+
+
+def get_json_hash(country_json):
+    return hashlib.sha256(country_json.encode()).hexdigest()
+
+
+def get_country_json(country_code):
+    with phase('country_query'):
+        return Country.objects.filter(country_code=country_code).values_list('country_df', flat=True).first()
+
+
+def get_country_data_version(country_code):
+    return country_data_versions.get(country_code, 0)
+
+
+def get_country_baseline(country_code):
+    key = (country_code, get_country_data_version(country_code))
+    with _baselines_lock:
+        baseline = _baselines.get(key)
+        if baseline is not None:
+            _baselines.move_to_end(key)
+    if baseline is not None:
+        if not baseline.from_db or time.monotonic() - baseline.checked_time < COUNTRY_BASELINE_TTL:
+            return baseline
+        return revalidate_country_baseline(baseline)
+
+    if country_store is not None and country_code in country_store:
+        return set_country_baseline(CountryBaseline.from_store(country_code, country_store, key[1]))
+    return set_country_baseline(CountryBaseline.from_db(country_code, key[1]))
+
+
+def revalidate_country_baseline(baseline):
+    """The cached baseline if its Country row is unchanged, else one built from the row, so changes saved by other
+    processes or by QuerySet.update(), which send no post_save here, are picked up within COUNTRY_BASELINE_TTL."""
+    country_json = get_country_json(baseline.country_code)
+    if get_json_hash(country_json) == baseline.data_hash:
+        baseline.checked_time = time.monotonic()
+        return baseline
+    invalidate_country_baseline(baseline.country_code)
+    return set_country_baseline(CountryBaseline.from_json(baseline.country_code, country_json,
+                                                          get_country_data_version(baseline.country_code)))
+
+
+def set_country_store(store):
+    global country_store
+    country_store = store
+    invalidate_country_baseline()
+
+
+def set_country_baseline(baseline):
+    key = (baseline.country_code, baseline.data_version)
+    with _baselines_lock:
+        country_data_versions[baseline.country_code] = max(baseline.data_version,
+                                                           get_country_data_version(baseline.country_code))
+        _baselines[key] = baseline
+        _baselines.move_to_end(key)
+        while len(_baselines) > COUNTRY_BASELINE_CACHE_SIZE:
+            _baselines.popitem(last=False)
+    return baseline
+
+
+def invalidate_country_baseline(country_code=None):
+    with _baselines_lock:
+        for code in ([country_code] if country_code else {key[0] for key in _baselines}):
+            country_data_versions[code] = get_country_data_version(code) + 1
+        for key in [key for key in _baselines if key[1] != get_country_data_version(key[0])]:
+            del _baselines[key]
+
+
+def country_saved(sender, instance, **kwargs):
+    invalidate_country_baseline(instance.country_code)
+
+
+post_save.connect(country_saved, sender=Country, dispatch_uid='invalidate_country_baseline')
@@ -0,0 +1,45 @@
+import multiprocessing
+from utils.constants import *
+from utils.country_store import COUNTRY_STORE_DIR, CountryStore
+from utils.path_engine import CleanTechParams, EngineBaseline, simulate_path
+from utils.result_format import get_run_outputs
+
+country_store = None
+
+
+def init_worker(store_dir):
+    global country_store
+    country_store = CountryStore(store_dir)
+
+
+def simulate_country(job):
+    country_code, cleantechs = job
+    baseline = EngineBaseline(country_store.get_columns(country_code), country_store.get_values(country_code))
+    run = simulate_path(baseline, [CleanTechParams(**fields) for fields in cleantechs])
+    return country_code, get_run_outputs(run, world=country_code == 'WRL')
+
+
+def get_cleantech_fields(path):
+    return [{field: getattr(cleantech, field, None) for field in CLEANTECH_SIM_FIELDS + ['name']}
+            for cleantech in path.cleantech_list.all()]
+
+
+def create_country_paths(path, country_codes=None, processes=None, store_dir=COUNTRY_STORE_DIR,
+                         chunk_size=COUNTRY_PATHS_CHUNK_SIZE):
+    """get_path_outputs of the Path simulated for each country in the country store, or only for country_codes. Other
+    countries than WRL get country_sim_emissions instead of the world-only total_sim_emissions and est_degree_rise.
+
+    Countries run in a process pool whose workers memory-map the store written by create_WRL_data.py and simulate
+    with path_engine, so they load neither Django nor the ORM.
+    """
+    store = CountryStore(store_dir)
+    if country_codes is None:
+        country_codes = store.country_codes
+    missing = [country_code for country_code in country_codes if country_code not in store]
+    if missing:
+        raise ValueError(f'No country data in {store_dir} for {missing}')
+
+    cleantechs = get_cleantech_fields(path)
+    jobs = [(country_code, cleantechs) for country_code in country_codes]
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(store_dir,)) as pool:
+        return dict(pool.imap_unordered(simulate_country, jobs, chunksize=chunk_size))
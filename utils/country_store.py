@@ -0,0 +1,70 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+COUNTRY_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'country',
+                                 'store')
+
+
+def write_country_store(country_dfs, directory=COUNTRY_STORE_DIR):
+    """Write {country_code: country_df} as one (country years x columns) float64 matrix plus an index of each
+    country's rows and columns, so readers can memory-map it."""
+    os.makedirs(directory, exist_ok=True)
+    columns = []
+    for country_df in country_dfs.values():
+        columns += [column for column in country_df.columns if column not in columns]
+    column_index = {column: idx for idx, column in enumerate(columns)}
+
+    values = np.full((sum([len(country_df) for country_df in country_dfs.values()]), len(columns)), np.nan)
+    countries = {}
+    start = 0
+    for country_code, country_df in country_dfs.items():
+        country_columns = [column_index[column] for column in country_df.columns]
+        values[start:start + len(country_df), country_columns] = country_df.values
+        countries[country_code] = {'rows': [start, start + len(country_df)], 'columns': country_columns}
+        start += len(country_df)
+
+    # Replace rather than overwrite, so processes that have the old files memory-mapped keep a valid copy
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.npy', delete=False) as f:
+        np.save(f, values)
+    os.replace(f.name, os.path.join(directory, 'country_data.npy'))
+    with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.json', delete=False) as f:
+        json.dump({'columns': columns, 'countries': countries}, f)
+    os.replace(f.name, os.path.join(directory, 'country_data.json'))
+
+
+class CountryStore:
+    def __init__(self, directory=COUNTRY_STORE_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, 'country_data.json')) as f:
+            index = json.load(f)
+        self.columns = index['columns']
+        self.countries = index['countries']
+        self.values = np.load(os.path.join(directory, 'country_data.npy'), mmap_mode='r')
+
+    def __contains__(self, country_code):
+        return country_code in self.countries
+
+    @property
+    def country_codes(self):
+        return list(self.countries)
+
+    def get_values(self, country_code):
+        country = self.countries[country_code]
+        return self.values[slice(*country['rows'])][:, country['columns']]
+
+    def get_columns(self, country_code):
+        return [self.columns[idx] for idx in self.countries[country_code]['columns']]
+
+    def get_country_df(self, country_code):
+        country_df = pd.DataFrame(self.get_values(country_code), columns=self.get_columns(country_code))
+        country_df['year'] = country_df['year'].astype(int)
+        return country_df
+
+    def get_data_hash(self, country_code):
+        data_hash = hashlib.sha256(np.ascontiguousarray(self.get_values(country_code)).tobytes())
+        data_hash.update(json.dumps(self.countries[country_code]['columns']).encode())
+        return data_hash.hexdigest()
@@ -0,0 +1,128 @@
+import copy
+import numpy as np
+from utils.constants import *
+from utils import sim_engine
+from utils.allcarbonfree_calcs import CleanTechObj, Path, get_cleantechs
+from utils.path_engine import get_total_sim_emissions
+
+
+class GoalSeek:
+    """Smallest value of one CleanTech parameter that takes a Path to zero emissions by target_year, or keeps its
+    total_sim_emissions (as calc_totals computes it) within emissions_budget.
+
+    Assumes the outcome only improves as the parameter grows. Every probe starts from the state just before the tech
+    starts, which is shared, and stops as soon as the target year is reached or the budget is spent.
+    """
+
+    def __init__(self, path, cleantech_id, parameter='growth_rate', target_year=None, emissions_budget=None):
+        if parameter not in GOAL_SEEK_BOUNDS:
+            raise ValueError(f'Cannot solve for {parameter}, use one of {list(GOAL_SEEK_BOUNDS)}')
+        if (target_year is None) == (emissions_budget is None):
+            raise ValueError('Set exactly one of target_year and emissions_budget')
+        self.parameter = parameter
+        self.target_year = target_year
+        self.emissions_budget = emissions_budget
+        self.probes = 0
+
+        self.fields = [{key: value for key, value in cleantech.__dict__.items() if not key.startswith('_')}
+                       for cleantech in get_cleantechs(path)]
+        cleantech_ids = [fields.get('id') for fields in self.fields]
+        if cleantech_id not in cleantech_ids:
+            raise ValueError(f'CleanTech {cleantech_id} is not in this Path')
+        self.tech_num = cleantech_ids.index(cleantech_id)
+
+        self.all_carbon_free = Path('WRL', engine='array')
+        self.all_carbon_free.set_starting_year(path.starting_year)
+        self.all_carbon_free.set_cleantech_list([CleanTechObj(**fields) for fields in self.fields])
+        self.all_carbon_free.reset_to_latest_year()
+        self.layout, self.years, self.increments = self.all_carbon_free.get_array_inputs()
+        if target_year is not None:
+            self.increments = sim_engine.get_increment_rows(self.increments, self.years <= target_year)
+            self.years = self.years[self.years <= target_year]
+
+        country_df = self.all_carbon_free.country_df_init
+        self.base_emissions = sum(country_df[country_df.year > 2010]['all_emissions'].values)
+        self.set_prefix()
+
+    def set_prefix(self):
+        techs = self.all_carbon_free.fossil_list + self.all_carbon_free.non_fossil_list
+        target = self.all_carbon_free.cleantech_list[self.tech_num]
+        self.slot = techs.index(target)
+
+        n_prefix = int(np.sum(self.years <= target.start_year))
+        start_row = self.layout.row_from_annual(self.all_carbon_free.annual)
+        increments = sim_engine.get_increment_rows(self.increments, slice(n_prefix))
+        state, n_years, _ = sim_engine.simulate_array(self.layout, start_row, self.years[:n_prefix], increments,
+                                                      techs)
+        self.prefix_techs = techs
+        self.prefix_years = n_years
+        self.prefix_row = state[n_years - 1] if n_years else start_row
+        self.prefix_emissions = state[:n_years, self.layout.all][self.years[:n_years] > 2010].sum()
+        self.prefix_zero = bool(n_years) and self.prefix_row[self.layout.all] < MAKE_ZERO
+
+    def meets_target(self, emissions, zero):
+        if self.target_year is not None:
+            return zero
+        return get_total_sim_emissions(self.base_emissions + emissions) <= self.emissions_budget
+
+    def probe(self, value):
+        self.probes += 1
+        if self.prefix_zero:
+            return self.meets_target(self.prefix_emissions, True)
+
+        techs = copy.deepcopy(self.prefix_techs)
+        techs[self.slot] = CleanTechObj(**dict(self.fields[self.tech_num], **{self.parameter: value}))
+        probe_path = copy.copy(self.all_carbon_free)
+        probe_path.set_cleantech_list(techs)
+
+        years = self.years[self.prefix_years:]
+        increments = sim_engine.get_increment_rows(self.increments, slice(self.prefix_years, None))
+        emissions = self.prefix_emissions
+
+        def stop(row, year_num):
+            nonlocal emissions
+            if years[year_num] > 2010:
+                emissions += row[self.layout.all]
+            return not self.meets_target(emissions, False) if self.emissions_budget is not None else False
+
+        state, n_years, _ = sim_engine.simulate_array(self.layout, self.prefix_row, years, increments,
+                                                      probe_path.fossil_list + probe_path.non_fossil_list, stop)
+        zero = bool(n_years) and state[n_years - 1, self.layout.all] < MAKE_ZERO
+        return self.meets_target(emissions, zero)
+
+    def solve(self, tolerance=GOAL_SEEK_TOLERANCE, max_probes=GOAL_SEEK_MAX_PROBES):
+        lower, upper = GOAL_SEEK_BOUNDS[self.parameter]
+        value = self.fields[self.tech_num][self.parameter] or 1.
+        if upper is not None:
+            value = min(value, upper)
+
+        if self.probe(value):
+            if self.probe(lower):
+                return self.get_result(lower)
+            low, high = lower, value
+        elif upper is not None:
+            if value >= upper or not self.probe(upper):
+                return self.get_result(None)
+            low, high = value, upper
+        else:
+            low, high = value, 2 * value
+            while not self.probe(high):
+                if self.probes >= max_probes:
+                    return self.get_result(None)
+                low, high = high, 2 * high
+
+        while high - low > tolerance * high and self.probes < max_probes:
+            mid = (low + high) / 2
+            if self.probe(mid):
+                high = mid
+            else:
+                low = mid
+        return self.get_result(high)
+
+    def get_result(self, value):
+        return {'parameter': self.parameter, 'value': value, 'feasible': value is not None, 'probes': self.probes}
+
+
+def solve_cleantech(path, cleantech_id, parameter='growth_rate', target_year=None, emissions_budget=None,
+                    tolerance=GOAL_SEEK_TOLERANCE, max_probes=GOAL_SEEK_MAX_PROBES):
+    return GoalSeek(path, cleantech_id, parameter, target_year, emissions_budget).solve(tolerance, max_probes)
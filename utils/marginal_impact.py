@@ -0,0 +1,67 @@
+import copy
+import numpy as np
+from utils.constants import *
+from utils import sim_engine
+from utils.allcarbonfree_calcs import CleanTechObj, Path, get_cleantechs
+
+
+def get_scenarios(all_carbon_free, cleantech_list):
+    """The full Path, each CleanTech left out, no CleanTechs, and each CleanTech on its own, in simulation order."""
+    scenarios = [cleantech_list] + \
+                [cleantech_list[:idx] + cleantech_list[idx + 1:] for idx in range(len(cleantech_list))] + \
+                [[]] + [[cleantech] for cleantech in cleantech_list]
+    techs = []
+    for scenario in scenarios:
+        scenario_path = copy.copy(all_carbon_free)
+        scenario_path.set_cleantech_list(scenario)
+        techs.append(scenario_path.fossil_list + scenario_path.non_fossil_list)
+    return techs
+
+
+def get_impact(total_sim_emissions, carbon_zero_year, without_idx, with_idx):
+    return {'total_sim_emissions': float(total_sim_emissions[without_idx] - total_sim_emissions[with_idx]),
+            'carbon_zero_year': int(carbon_zero_year[without_idx] - carbon_zero_year[with_idx])}
+
+
+def get_marginal_impacts(path):
+    """Each CleanTech's reduction of total_sim_emissions and of carbon_zero_year, leaving it out of the full Path and
+    adding it alone to a Path with no CleanTechs, sorted by the leave-one-out reduction.
+
+    All 2N+2 variants run as one batch. The years before the first CleanTech starts are the same for every variant
+    and are simulated once.
+    """
+    all_carbon_free = Path('WRL', engine='array')
+    all_carbon_free.set_starting_year(path.starting_year)
+    cleantech_list = [CleanTechObj(**cleantech.__dict__) for cleantech in get_cleantechs(path)]
+    all_carbon_free.set_cleantech_list(cleantech_list)
+    all_carbon_free.reset_to_latest_year()
+    layout, years, increments = all_carbon_free.get_array_inputs()
+
+    n_prefix = int(np.sum(years <= min([tech.start_year for tech in cleantech_list], default=years[-1])))
+    start_row = layout.row_from_annual(all_carbon_free.annual)
+    prefix, n_prefix, _ = sim_engine.simulate_array(layout, start_row, years[:n_prefix],
+                                                    sim_engine.get_increment_rows(increments, slice(n_prefix)), [])
+    prefix = prefix[:n_prefix]
+    if n_prefix:
+        start_row = prefix[-1]
+    batch_start = len(years) if n_prefix and start_row[layout.all] < MAKE_ZERO else n_prefix
+
+    batch = sim_engine.TechBatch(layout, get_scenarios(all_carbon_free, cleantech_list))
+    increments = sim_engine.get_increment_rows(increments, slice(batch_start, None))
+    history, n_years, _ = sim_engine.simulate_batch(layout, start_row, years[batch_start:], increments, batch,
+                                                    record=[layout.all], record_units=False)
+    all_emissions = np.concatenate([np.repeat(prefix[:, layout.all, None], len(n_years), axis=1), history[:, :, 0]])
+    total_sim_emissions, carbon_zero_year = all_carbon_free.calc_batch_totals(years, all_emissions,
+                                                                              n_years + n_prefix)
+
+    n_techs = len(cleantech_list)
+    impacts = [{'id': cleantech.id, 'name': getattr(cleantech, 'name', None),
+                'leave_one_out': get_impact(total_sim_emissions, carbon_zero_year, idx + 1, 0),
+                'add_one': get_impact(total_sim_emissions, carbon_zero_year, n_techs + 1, n_techs + idx + 2)}
+               for idx, cleantech in enumerate(cleantech_list)]
+    impacts.sort(key=lambda impact: impact['leave_one_out']['total_sim_emissions'], reverse=True)
+    return {'total_sim_emissions': float(total_sim_emissions[0]),
+            'carbon_zero_year': int(carbon_zero_year[0]),
+            'baseline_total_sim_emissions': float(total_sim_emissions[n_techs + 1]),
+            'baseline_carbon_zero_year': int(carbon_zero_year[n_techs + 1]),
+            'cleantechs': impacts}
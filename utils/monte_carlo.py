@@ -0,0 +1,48 @@
+import numpy as np
+from utils.constants import *
+from utils import sim_engine
+from utils.allcarbonfree_calcs import CleanTechObj, Path, get_cleantechs
+from utils.path_engine import get_est_degree_rise
+
+
+def sample_batch(batch, n_draws, spread, rng):
+    draws = batch.repeat(n_draws)
+    for name, rel_spread in spread.items():
+        values = getattr(draws, name)
+        values *= np.exp(rng.normal(0, rel_spread, size=values.shape))
+        if name == 'limit_perc':
+            np.minimum(values, 1, out=values)
+    draws.limiter_unit = np.where(draws.replace_fossil, draws.electric_energy_per_unit, draws.CO2_reduced_per_unit)
+    return draws
+
+
+def get_percentiles(values, percentiles, axis=0):
+    return {percentile: band.tolist() for percentile, band in
+            zip(percentiles, np.percentile(values, percentiles, axis=axis))}
+
+
+def simulate_monte_carlo(path, n_draws=MONTE_CARLO_DRAWS, spread=None, percentiles=MONTE_CARLO_PERCENTILES,
+                         seed=None):
+    spread = MONTE_CARLO_SPREAD if spread is None else spread
+    rng = np.random.default_rng(seed)
+
+    all_carbon_free = Path('WRL', engine='array')
+    all_carbon_free.set_starting_year(path.starting_year)
+    all_carbon_free.set_cleantech_list([CleanTechObj(**cleantech.__dict__) for cleantech in get_cleantechs(path)])
+    all_carbon_free.reset_to_latest_year()
+
+    layout, years, increments = all_carbon_free.get_array_inputs()
+    batch = sim_engine.TechBatch(layout, [all_carbon_free.fossil_list + all_carbon_free.non_fossil_list])
+    draws = sample_batch(batch, n_draws, spread, rng)
+    history, n_years, _ = sim_engine.simulate_batch(layout, layout.row_from_annual(all_carbon_free.annual), years,
+                                                    increments, draws, record=[layout.all], record_units=False)
+
+    all_emissions = np.where(np.arange(len(history))[:, None] < n_years[None, :], history[:, :, 0], 0.)
+    total_sim_emissions, carbon_zero_year = all_carbon_free.calc_batch_totals(years, history[:, :, 0], n_years)
+
+    return {'years': years[:len(all_emissions)].tolist(),
+            'n_draws': n_draws,
+            'all_emissions': get_percentiles(all_emissions, percentiles, axis=1),
+            'carbon_zero_year': get_percentiles(carbon_zero_year, percentiles),
+            'total_sim_emissions': get_percentiles(total_sim_emissions, percentiles),
+            'est_degree_rise': get_percentiles(get_est_degree_rise(total_sim_emissions), percentiles)}
@@ -0,0 +1,241 @@
+import json
+import numpy as np
+from utils.constants import *
+from utils import sim_engine
+
+
+class CleanTechParams:
+    """The simulation fields of one CleanTech and its running state. Takes a CleanTech's fields as dicts and/or keyword
+    arguments, e.g. cleantech.__dict__ of an ORM object, and ignores fields the simulation does not use."""
+
+    __slots__ = CLEANTECH_SIM_FIELDS + ['name', 'units_per_year', 'max_prod', 'replace', 'limiter_unit',
+                                        'sectors_changed', 'sim_key']
+
+    def __init__(self, *initial_data, **kwargs):
+        fields = {}
+        for dictionary in initial_data:
+            fields.update(dictionary)
+        fields.update(kwargs)
+        for field in CLEANTECH_SIM_FIELDS + ['name']:
+            setattr(self, field, fields.get(field))
+        self.sim_key = json.dumps([getattr(self, field) for field in CLEANTECH_SIM_FIELDS], default=str)
+        self.replace = None
+        self.sectors_changed = None
+
+        if self.all_subsectors:
+            if isinstance(self.all_subsectors, str):
+                self.all_subsectors = json.loads(self.all_subsectors)
+            self.all_subsectors = flatten(self.all_subsectors)
+
+        self.units_per_year = [self.before_start_year_units, self.start_year_units]
+        self.max_prod = self.units_per_year[-2] - self.units_per_year[-1]
+
+        if self.replace_fossil:  # Clean Energy Source
+            self.limiter_unit = self.electric_energy_per_unit
+        else:  # Reduce/Replace Carbon Emissions
+            self.limiter_unit = self.CO2_reduced_per_unit
+
+    def add_to_annual_output(self, output):
+        self.units_per_year.append(output)
+
+    def calc_max_replace_units(self, annual):
+        if self.replace_fossil:
+            self.replace = annual['fossil']
+        else:
+            self.replace = sum([annual[subsector] for subsector in self.all_subsectors])
+
+
+def is_fossil_powered(cleantech):
+    return (cleantech.electric_generation_type == 'fossil') or (cleantech.electric_generation_type is None)
+
+
+def fit_energy_use_params(years, subsector_emissions, subsectors, years_back=10):
+    """Log fit of each subsector's emissions over the last years_back rows, as used by get_energy_increments."""
+    years = years[-years_back:]
+    log_years = np.log(years - min(years) + 1)
+    params = {}
+    for subsector_num, subsector_idx in enumerate(subsectors):
+        values = subsector_emissions[-years_back:, subsector_num]
+        params[subsector_idx] = np.append(np.polyfit(log_years, values - min(values), 1), years_back)
+    return params
+
+
+def get_energy_increments(inc_emission_params, subsectors, latest_year, ending_year):
+    """(years x subsectors) emissions added by increasing energy use in each year after latest_year."""
+    params = np.array([inc_emission_params[ss_idx] for ss_idx in subsectors]).reshape(-1, 3).T
+    offsets = np.arange(1, ending_year - latest_year + 1)[:, None]
+    return (params[1] + params[0] * np.log(offsets + 1 + params[2])) - \
+           (params[1] + params[0] * np.log(offsets + params[2]))
+
+
+class EngineBaseline:
+    """A country's historical data as a (years x columns) float matrix with the column names of WRL_data.csv, e.g.
+    from CountryStore.get_values, and everything a simulation needs from it."""
+
+    __slots__ = ('columns', 'values', 'years', 'latest_year', 'layout', 'start_row', 'inc_emission_params',
+                 'energy_increments')
+
+    def __init__(self, columns, values, starting_year=2000):
+        self.columns = list(columns)
+        values = np.asarray(values, dtype=float)
+        years = values[:, self.columns.index('year')].astype(int)
+        self.values = values[years >= starting_year]
+        self.years = years[years >= starting_year]
+        self.latest_year = int(self.years.max())
+
+        subsectors = [ss_idx for ss_idx in SUBSECTORS if f'{ss_idx}_emissions' in self.columns]
+        self.layout = sim_engine.StateLayout(subsectors)
+        latest = self.values[self.years == self.latest_year][0]
+        self.start_row = np.array([latest[self.columns.index(column)] if column in self.columns else 0.
+                                   for column in self.layout.columns])
+        self.inc_emission_params = fit_energy_use_params(self.years, self.get_values(
+            [f'{ss_idx}_emissions' for ss_idx in self.layout.subsectors]), self.layout.subsectors)
+        self.energy_increments = {}
+
+    def get_values(self, columns):
+        return self.values[:, [self.columns.index(column) for column in columns]]
+
+    def get_energy_increments(self, ending_year):
+        if ending_year not in self.energy_increments:
+            self.energy_increments[ending_year] = get_energy_increments(self.inc_emission_params,
+                                                                        self.layout.subsectors, self.latest_year,
+                                                                        ending_year)
+        return self.energy_increments[ending_year]
+
+
+class PathRun:
+    """The simulated years of one Path, after the baseline's historical years."""
+
+    __slots__ = ('baseline', 'cleantechs', 'techs', 'years', 'state', 'unit_counts')
+
+    def __init__(self, baseline, cleantechs, techs, years, state, unit_counts):
+        self.baseline = baseline
+        self.cleantechs = cleantechs
+        self.techs = techs
+        self.years = years
+        self.state = state
+        self.unit_counts = unit_counts
+
+    def get_frame_values(self, columns):
+        """(historical + simulated years x columns) values, as Path.country_df holds them after simulate. Columns the
+        simulation does not change keep their latest historical value."""
+        baseline = self.baseline
+        sim_values = np.repeat(baseline.get_values(columns)[baseline.years == baseline.latest_year][:1],
+                               len(self.years), axis=0)
+        for column_num, column in enumerate(columns):
+            if column == 'year':
+                sim_values[:, column_num] = self.years
+            elif column in baseline.layout.columns:
+                sim_values[:, column_num] = self.state[:, baseline.layout.columns.index(column)]
+        return np.concatenate([baseline.get_values(columns), sim_values])
+
+    def get_summary(self, world=True):
+        """get_summary outputs. total_sim_emissions adds the world's emissions up to 2010 and est_degree_rise is the
+        world warming estimate, so for a single country (world=False) both are replaced by country_sim_emissions, its
+        own emissions after 2010 in Gt."""
+        years, all_emissions, carbon_free_electricity = self.get_frame_values(
+            ['year', 'all_emissions', 'carbon_free_electricity']).T
+        emissions_after_2010 = sum(all_emissions[years > 2010])
+        carbon_zero_year = self.years[-1] if len(self.years) else self.baseline.latest_year
+        if not world:
+            return get_country_summary(emissions_after_2010, max(carbon_free_electricity) * TWH_TO_GW,
+                                       carbon_zero_year)
+        return get_summary(get_total_sim_emissions(emissions_after_2010), max(carbon_free_electricity) * TWH_TO_GW,
+                           carbon_zero_year)
+
+    def get_trajectories(self):
+        tech_nums = {id(tech): tech_num for tech_num, tech in enumerate(self.techs)}
+        unit_counts = self.unit_counts[:, [tech_nums[id(tech)] for tech in self.cleantechs]]
+        layout = self.baseline.layout
+        fossil_electricity = np.concatenate([self.baseline.start_row[None, layout.fossil_slice],
+                                             self.state[:, layout.fossil_slice]])[:len(self.years)]
+        return get_trajectories(self.cleantechs, self.years, unit_counts, fossil_electricity)
+
+
+def get_total_sim_emissions(emissions_after_2010):
+    """The world's cumulative emissions in Gt, from the tons emitted after 2010 (a float or an array)."""
+    return (EMISSIONS_TO_2010 + emissions_after_2010) * 1e-9
+
+
+def get_est_degree_rise(total_sim_emissions):
+    return total_sim_emissions * .00055 - 0.05
+
+
+def get_summary(total_sim_emissions, max_carbon_free_electricity, carbon_zero_year):
+    return {'total_sim_emissions': int(total_sim_emissions),
+            'max_carbon_free_electricity': int(max_carbon_free_electricity),
+            'est_degree_rise': round(get_est_degree_rise(total_sim_emissions), 1),
+            'carbon_zero_year': int(carbon_zero_year)}
+
+
+def get_country_summary(emissions_after_2010, max_carbon_free_electricity, carbon_zero_year):
+    """get_summary of a single country, with its own emissions after 2010 in Gt in place of the world-only
+    total_sim_emissions and est_degree_rise."""
+    return {'country_sim_emissions': round(emissions_after_2010 * 1e-9, 3),
+            'max_carbon_free_electricity': int(max_carbon_free_electricity),
+            'carbon_zero_year': int(carbon_zero_year)}
+
+
+def get_trajectories(cleantechs, years, unit_counts, fossil_electricity):
+    """Every CleanTech's units in use, emissions avoided and carbon-free electricity generated at the end of each
+    year, as (cleantechs x years) matrices, from the (years x cleantechs) length of its units_per_year at the end of
+    that year. NaN before a CleanTech's start_year.
+
+    fossil_electricity is the (years x FOSSIL_TYPES) fossil generation at the start of each year. Emissions avoided
+    counts only the units added since start_year_units, as the simulation applies them: CO2_reduced_per_unit times
+    those units for subsector reducers, plus the Electricity & heat emissions they displace at the fossil mix of the
+    year they were added for replace_fossil generators, less those added by the fossil electricity of fossil-powered
+    CleanTechs.
+    """
+    units = np.full((len(cleantechs), len(years)), np.nan)
+    for tech_num, tech in enumerate(cleantechs):
+        started = np.asarray(years) >= tech.start_year
+        units[tech_num, started] = np.asarray(tech.units_per_year)[unit_counts[started, tech_num] - 1]
+
+    fossil_electricity = np.asarray(fossil_electricity, dtype=float).reshape(len(years), len(FOSSIL_TYPES))
+    fossil = fossil_electricity.sum(axis=1, keepdims=True)
+    fossil_co2 = np.array([CO2_LBS_PER_KWH[elec_type] for elec_type in FOSSIL_TYPES]) * TWH_TO_KWH * LBS_TO_TONS
+    default_perc = np.array([1. if elec_type == 'gas' else 0. for elec_type in FOSSIL_TYPES])
+    elec_type_perc = np.divide(fossil_electricity, fossil, out=np.zeros_like(fossil_electricity), where=fossil > 0)
+    displaced_per_unit = elec_type_perc @ fossil_co2
+    added_per_unit = np.where(fossil[:, 0] > 0, displaced_per_unit, default_perc @ fossil_co2)
+    start_units = np.array([tech.units_per_year[1] for tech in cleantechs], dtype=float)[:, None]
+    new_units = np.diff(np.where(np.isnan(units), start_units, units), axis=1, prepend=start_units)
+
+    CO2_reduced_per_unit = np.array([tech.CO2_reduced_per_unit if tech.all_subsectors else 0.
+                                     for tech in cleantechs], dtype=float)
+    displaces_fossil = np.array([bool(tech.replace_fossil) and not is_fossil_powered(tech) for tech in cleantechs])
+    fossil_used_per_unit = np.array([tech.electric_energy_per_unit if is_fossil_powered(tech) else 0.
+                                     for tech in cleantechs], dtype=float)
+    electricity_emissions = displaces_fossil[:, None] * new_units * displaced_per_unit - \
+        fossil_used_per_unit[:, None] * new_units * added_per_unit
+    emissions_avoided = (units - start_units) * CO2_reduced_per_unit[:, None] + np.cumsum(electricity_emissions, axis=1)
+    emissions_avoided[np.isnan(units)] = np.nan
+
+    electric_energy_per_unit = np.array([tech.electric_energy_per_unit
+                                         if tech.electric_generation_type in CARBON_FREE_TYPES else 0.
+                                         for tech in cleantechs], dtype=float)
+    return {'years': np.asarray(years, dtype=int),
+            'cleantech_ids': [tech.id for tech in cleantechs],
+            'units': units,
+            'emissions_avoided': emissions_avoided,
+            'electricity_generated': units * electric_energy_per_unit[:, None]}
+
+
+def simulate_path(baseline, cleantechs, ending_year=2100, increase_energy_use=True, time_resolution='year'):
+    """Simulate CleanTechParams from the year after baseline.latest_year, with the array engine, in steps of a year,
+    quarter or month (TIME_RESOLUTIONS)."""
+    steps_per_year = sim_engine.get_steps_per_year(time_resolution)
+    subsectors = set(baseline.layout.subsectors)
+    for tech in cleantechs:
+        if tech.all_subsectors:
+            tech.all_subsectors = [ss_idx for ss_idx in tech.all_subsectors if ss_idx in subsectors]
+    techs = [tech for tech in cleantechs if is_fossil_powered(tech)] + \
+            [tech for tech in cleantechs if not is_fossil_powered(tech)]
+
+    years = np.arange(baseline.latest_year + 1, ending_year + 1)
+    increments = baseline.get_energy_increments(ending_year) if increase_energy_use else None
+    state, n_years, tech_states = sim_engine.simulate_array(baseline.layout, baseline.start_row, years, increments,
+                                                            techs, steps_per_year=steps_per_year)
+    return PathRun(baseline, cleantechs, techs, years[:n_years], state[:n_years],
+                   tech_states[:n_years, :, 0].astype(int))
@@ -0,0 +1,253 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pytz
+from django.db.models.signals import post_delete
+from paths.models import Path as PathModel
+from utils.constants import *
+from utils.result_format import decode_frame
+
+
+def get_emissions_curve(country_df):
+    """All-sector emissions of a saved country_df (JSON or encoded) at PATH_INDEX_CURVE_YEARS, 0 after the last
+    simulated year."""
+    country_df = decode_frame(country_df)
+    emissions = country_df[[f'{sector_idx}_emissions' for sector_idx in SECTORS]].sum(axis=1)
+    return emissions.groupby(level=0).last().reindex(PATH_INDEX_CURVE_YEARS).fillna(0).values
+
+
+class PathSummaryIndex:
+    """Scalar outputs, an emissions curve and CleanTech membership of saved Paths, one row per Path in columnar
+    arrays, so Paths can be ranked and filtered without loading their outputs.
+
+    Membership is one bitmap (a Python int, bit n for row n) per CleanTech id.
+    """
+
+    def __init__(self, capacity=1024):
+        self.lock = threading.Lock()
+        self.rows = {}
+        self.row_cleantechs = {}
+        self.free_rows = []
+        self.size = 0
+        self.pks = np.empty(capacity, dtype=object)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.columns = {field: np.zeros(capacity, dtype=dtype) for field, dtype in PATH_INDEX_FIELDS.items()}
+        self.emissions_curve = np.zeros((capacity, len(PATH_INDEX_CURVE_YEARS)), dtype=np.float32)
+        self.cleantechs = {}
+        self.refreshed_time = None
+        self.checked_time = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, pk):
+        return pk in self.rows
+
+    def grow(self):
+        capacity = 2 * len(self.valid)
+        self.pks = np.resize(self.pks, capacity)
+        self.valid = np.concatenate([self.valid, np.zeros(capacity - len(self.valid), dtype=bool)])
+        self.columns = {field: np.resize(column, capacity) for field, column in self.columns.items()}
+        self.emissions_curve = np.resize(self.emissions_curve, (capacity, len(PATH_INDEX_CURVE_YEARS)))
+
+    def get_row(self, pk):
+        if pk in self.rows:
+            row = self.rows[pk]
+            self.clear_cleantechs(row)
+        elif self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            if self.size == len(self.valid):
+                self.grow()
+            row = self.size
+            self.size += 1
+        self.rows[pk] = row
+        return row
+
+    def clear_cleantechs(self, row):
+        for cleantech_id in self.row_cleantechs.pop(row, []):
+            self.cleantechs[cleantech_id] &= ~(1 << row)
+
+    def update(self, pk, outputs, cleantech_ids, emissions_curve=None):
+        """Add or replace the row of the Path with this pk from its create_path outputs."""
+        if emissions_curve is None:
+            emissions_curve = get_emissions_curve(outputs['country_df'])
+        with self.lock:
+            row = self.get_row(pk)
+            self.pks[row] = pk
+            self.valid[row] = True
+            for field, column in self.columns.items():
+                column[row] = outputs[field]
+            self.emissions_curve[row] = emissions_curve
+            self.row_cleantechs[row] = list(cleantech_ids)
+            for cleantech_id in cleantech_ids:
+                self.cleantechs[cleantech_id] = self.cleantechs.get(cleantech_id, 0) | (1 << row)
+
+    def update_path(self, path):
+        """update from a saved Path's stored outputs."""
+        self.update(path.pk, {field: getattr(path, field) for field in list(PATH_INDEX_FIELDS) + ['country_df']},
+                    [cleantech.id for cleantech in path.cleantech_list.all()])
+
+    def remove(self, pk):
+        with self.lock:
+            row = self.rows.pop(pk, None)
+            if row is None:
+                return
+            self.clear_cleantechs(row)
+            self.valid[row] = False
+            self.pks[row] = None
+            self.free_rows.append(row)
+
+    def get_cleantech_mask(self, cleantech_id):
+        bitmap = self.cleantechs.get(cleantech_id, 0)
+        bits = np.frombuffer(bitmap.to_bytes((self.size + 7) // 8, 'little'), dtype=np.uint8)
+        return np.unpackbits(bits, count=self.size, bitorder='little').astype(bool)
+
+    def get_mask(self, cleantech_ids=(), **ranges):
+        """Rows of Paths that contain every CleanTech in cleantech_ids and have each field in ranges within its
+        (low, high) bounds, inclusive; None leaves a bound open."""
+        mask = self.valid[:self.size].copy()
+        for cleantech_id in cleantech_ids:
+            mask &= self.get_cleantech_mask(cleantech_id)
+        for field, (low, high) in ranges.items():
+            column = self.columns[field][:self.size]
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        return mask
+
+    def query(self, cleantech_ids=(), **ranges):
+        with self.lock:
+            return self.pks[:self.size][self.get_mask(cleantech_ids, **ranges)].tolist()
+
+    def top_k(self, field, k, ascending=True, cleantech_ids=(), **ranges):
+        """pks of the k Paths with the lowest (or highest) field among those matching query's filters."""
+        with self.lock:
+            rows = np.flatnonzero(self.get_mask(cleantech_ids, **ranges))
+            values = self.columns[field][rows] if ascending else -self.columns[field][rows].astype(float)
+            if k < len(rows):
+                top = np.argpartition(values, k)[:k]
+                rows, values = rows[top], values[top]
+            return self.pks[rows[np.argsort(values, kind='stable')]].tolist()
+
+    def get_summaries(self, pks):
+        with self.lock:
+            rows = [self.rows[pk] for pk in pks]
+            return [dict({field: column[row].item() for field, column in self.columns.items()}, pk=pk,
+                         emissions_curve=self.emissions_curve[row].tolist()) for pk, row in zip(pks, rows)]
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            rows = np.flatnonzero(self.valid[:self.size])
+            np.savez(os.path.join(directory, 'path_index.npz'), emissions_curve=self.emissions_curve[rows],
+                     **{field: column[rows] for field, column in self.columns.items()})
+            with open(os.path.join(directory, 'path_index.json'), 'w') as f:
+                json.dump({'pks': self.pks[rows].tolist(),
+                           'cleantech_ids': [self.row_cleantechs.get(row, []) for row in rows],
+                           'refreshed_time': self.refreshed_time.isoformat() if self.refreshed_time else None},
+                          f, default=str)
+
+    def copy_from(self, other):
+        """Replace every row with those of other, e.g. from build_path_index or load, in place, so modules holding
+        this index see them."""
+        with self.lock:
+            for name, value in vars(other).items():
+                if name != 'lock':
+                    setattr(self, name, value)
+
+    @classmethod
+    def from_rows(cls, pks, columns, cleantech_ids, emissions_curves):
+        """Index of many Paths at once: pks, {field: values} and emissions_curves in row order, and each row's
+        CleanTech ids. Builds each CleanTech's bitmap in one pass instead of one update per row."""
+        path_index = cls(max(len(pks), 1))
+        size = len(pks)
+        path_index.size = size
+        path_index.rows = {pk: row for row, pk in enumerate(pks)}
+        path_index.pks[:size] = pks
+        path_index.valid[:size] = True
+        for field, column in path_index.columns.items():
+            column[:size] = columns[field]
+        path_index.emissions_curve[:size] = emissions_curves
+
+        members = {}
+        for row, row_cleantech_ids in enumerate(cleantech_ids):
+            path_index.row_cleantechs[row] = list(row_cleantech_ids)
+            for cleantech_id in row_cleantech_ids:
+                members.setdefault(cleantech_id, []).append(row)
+        for cleantech_id, rows in members.items():
+            bits = np.zeros(size, dtype=bool)
+            bits[rows] = True
+            path_index.cleantechs[cleantech_id] = int.from_bytes(np.packbits(bits, bitorder='little').tobytes(),
+                                                                 'little')
+        return path_index
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, 'path_index.json')) as f:
+            index = json.load(f)
+        arrays = np.load(os.path.join(directory, 'path_index.npz'))
+        path_index = cls.from_rows(index['pks'], {field: arrays[field] for field in PATH_INDEX_FIELDS},
+                                   index['cleantech_ids'], arrays['emissions_curve'])
+        if index.get('refreshed_time'):
+            path_index.refreshed_time = datetime.fromisoformat(index['refreshed_time'])
+        return path_index
+
+
+def build_path_index(paths):
+    """PathSummaryIndex of saved Paths, e.g. PathModel.objects.prefetch_related('cleantech_list'), from the outputs
+    create_path stored on them."""
+    paths = [path for path in paths if path.country_df]
+    return PathSummaryIndex.from_rows([path.pk for path in paths],
+                                      {field: [getattr(path, field) for path in paths] for field in PATH_INDEX_FIELDS},
+                                      [[cleantech.id for cleantech in path.cleantech_list.all()] for path in paths],
+                                      [get_emissions_curve(path.country_df) for path in paths])
+
+
+path_index = PathSummaryIndex()
+_refresh_lock = threading.Lock()
+
+
+def refresh_path_index():
+    """Bring path_index in step with saved Paths, including those saved or deleted by other processes: build it
+    on first use, then re-read only Paths saved since the last refresh and drop deleted ones."""
+    with _refresh_lock:
+        refreshed_time = pytz.utc.localize(datetime.now())
+        paths = PathModel.objects.prefetch_related('cleantech_list')
+        if path_index.refreshed_time is None:
+            path_index.copy_from(build_path_index(paths))
+        else:
+            # Paths are stamped before they are saved, so look back far enough to catch saves still in progress
+            for path in paths.filter(time__gte=path_index.refreshed_time - timedelta(seconds=PATH_INDEX_TTL)):
+                if path.country_df:
+                    path_index.update_path(path)
+            saved = set(PathModel.objects.values_list('pk', flat=True))
+            for pk in [pk for pk in list(path_index.rows) if pk not in saved]:
+                path_index.remove(pk)
+        path_index.refreshed_time = refreshed_time
+        path_index.checked_time = time.monotonic()
+
+
+def get_path_index():
+    """path_index for queries, refreshed from saved Paths every PATH_INDEX_TTL seconds."""
+    if path_index.checked_time is None or time.monotonic() - path_index.checked_time >= PATH_INDEX_TTL:
+        refresh_path_index()
+    return path_index
+
+
+def load_path_index(directory):
+    """Install an index saved with PathSummaryIndex.save, e.g. at startup instead of building it from every saved
+    Path, and catch up with Paths saved since."""
+    path_index.copy_from(PathSummaryIndex.load(directory))
+    refresh_path_index()
+
+
+def path_deleted(sender, instance, **kwargs):
+    path_index.remove(instance.pk)
+
+
+post_delete.connect(path_deleted, sender=PathModel, dispatch_uid='remove_from_path_index')
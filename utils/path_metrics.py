@@ -0,0 +1,73 @@
+import contextvars
+import json
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+
+metrics_sink = None
+_current_metrics = contextvars.ContextVar('path_metrics', default=None)
+_no_phase = nullcontext()
+
+
+class PathMetrics:
+    """Phase durations (seconds, summed if a phase repeats) and counters of one create_path call."""
+
+    def __init__(self, **labels):
+        self.labels = labels
+        self.phases = {}
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.) + time.perf_counter() - start
+
+    def set(self, name, value):
+        self.counters[name] = value
+
+    def as_dict(self):
+        return dict(self.labels, phases=dict(self.phases), **self.counters)
+
+
+class LoggingSink:
+    """Logs each record as one JSON line, for log-based metrics pipelines."""
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('allcarbonfree.path_metrics')
+        self.level = level
+
+    def __call__(self, record):
+        self.logger.log(self.level, json.dumps(record, default=str))
+
+
+def set_metrics_sink(sink):
+    """Send a record dict per create_path call to sink(record); None turns recording off."""
+    global metrics_sink
+    metrics_sink = sink
+
+
+@contextmanager
+def record_path_metrics(**labels):
+    """PathMetrics for the calls made inside the block, or None when no sink is set. Sent to the sink on exit."""
+    sink = metrics_sink
+    if sink is None:
+        yield None
+        return
+
+    metrics = PathMetrics(**labels)
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_metrics.reset(token)
+        sink(metrics.as_dict())
+
+
+def phase(name):
+    """Time a phase of the create_path call being recorded, if any, so deeper code such as baseline loading can
+    report without being passed the PathMetrics."""
+    metrics = _current_metrics.get()
+    return _no_phase if metrics is None else metrics.phase(name)
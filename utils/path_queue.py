@@ -0,0 +1,119 @@
+import asyncio
+import functools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.constants import *
+from utils.allcarbonfree_calcs import check_saved_country, create_path, get_cleantechs, save_path_outputs
+from utils.country_baselines import get_country_baseline
+from utils.path_results import get_path_key
+
+
+def get_request_key(path, options):
+    """Requests with the same key get the same create_path outputs."""
+    country_code = options.get('country_code', 'WRL')
+    key = get_path_key(get_cleantechs(path), path.starting_year, get_country_baseline(country_code).data_hash)
+    return json.dumps([key, options], sort_keys=True, default=str)
+
+
+class PathQueue:
+    """Runs create_path for asyncio callers on a bounded pool of workers, in process and without a broker.
+
+    Requests for the same CleanTechs, starting_year and options that arrive while one is queued or running wait for
+    that computation instead of starting another; each waiter then gets its own author and save_path applied.
+    """
+
+    def __init__(self, workers=PATH_QUEUE_WORKERS, executor=None):
+        self.workers = workers
+        self.executor = executor or ThreadPoolExecutor(workers)
+        self.queue = None
+        self.tasks = []
+        self.in_flight = {}
+        self.running = 0
+        self.submitted = 0
+        self.merged = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_time = 0.
+        self.max_wait_time = 0.
+
+    def start(self):
+        if not self.tasks:
+            self.queue = asyncio.Queue()
+            self.tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        for future in self.in_flight.values():
+            future.cancel()
+        self.in_flight.clear()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def run(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.executor,
+                                                                functools.partial(func, *args, **kwargs))
+
+    async def create_path(self, path, author=None, save_path=False, **options):
+        """create_path(path, author, save_path, **options), sharing the computation with identical requests."""
+        if save_path:
+            check_saved_country(options.get('country_code', 'WRL'))
+        self.start()
+        key = await self.run(get_request_key, path, options)
+        self.submitted += 1
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            future.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self.in_flight[key] = future
+            self.queue.put_nowait((key, path, options, time.perf_counter()))
+        else:
+            self.merged += 1
+
+        outputs = await asyncio.shield(future)
+        await self.run(save_path_outputs, path, outputs, author=author, save_path=save_path)
+        return outputs
+
+    async def work(self):
+        while True:
+            key, path, options, queued_time = await self.queue.get()
+            wait_time = time.perf_counter() - queued_time
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+            future = self.in_flight[key]
+            self.running += 1
+            try:
+                outputs = await self.run(create_path, path, **options)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                self.failed += 1
+                future.set_exception(e)
+            else:
+                self.completed += 1
+                future.set_result(outputs)
+            finally:
+                self.running -= 1
+                del self.in_flight[key]
+                self.queue.task_done()
+
+    def get_metrics(self):
+        started = self.completed + self.failed + self.running
+        return {'queue_depth': self.queue.qsize() if self.queue is not None else 0,
+                'in_flight': len(self.in_flight),
+                'running': self.running,
+                'submitted': self.submitted,
+                'merged': self.merged,
+                'completed': self.completed,
+                'failed': self.failed,
+                'mean_wait_time': self.total_wait_time / started if started else 0.,
+                'max_wait_time': self.max_wait_time}
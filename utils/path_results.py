@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from utils.constants import *
+
+
+def get_path_key(cleantechs, starting_year, data_hash):
+    cleantech_fields = [{field: getattr(cleantech, field, None) for field in CLEANTECH_SIM_FIELDS}
+                        for cleantech in cleantechs]
+    key_data = json.dumps([cleantech_fields, starting_year, data_hash], sort_keys=True, default=str)
+    return hashlib.sha256(key_data.encode()).hexdigest()
+
+
+class DiskBackend:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        try:
+            with open(os.path.join(self.directory, f'{key}.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, outputs):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(outputs, f)
+        os.replace(tmp_path, os.path.join(self.directory, f'{key}.json'))
+
+
+class PathResultCache:
+    def __init__(self, max_size=PATH_RESULT_CACHE_SIZE, backend=None):
+        self.max_size = max_size
+        self.backend = backend
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                return self.results[key]
+        if self.backend is None:
+            return None
+        outputs = self.backend.get(key)
+        if outputs is not None:
+            self.add(key, outputs)
+        return outputs
+
+    def set(self, key, outputs):
+        self.add(key, outputs)
+        if self.backend is not None:
+            self.backend.set(key, outputs)
+
+    def add(self, key, outputs):
+        with self.lock:
+            self.results[key] = outputs
+            self.results.move_to_end(key)
+            while len(self.results) > self.max_size:
+                self.results.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            return self.results.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
+
+path_results = PathResultCache()
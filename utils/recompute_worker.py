@@ -0,0 +1,19 @@
+from utils.path_engine import CleanTechParams, EngineBaseline, simulate_path
+from utils.result_format import get_run_outputs
+
+engine_baseline = None
+
+
+def init_worker(columns, values):
+    global engine_baseline
+    engine_baseline = EngineBaseline(columns, values)
+
+
+def simulate_chunk(jobs, country_code='WRL', baseline=None):
+    """get_path_outputs of each (pk, CleanTech fields) job of bulk_recompute, simulated with path_engine on baseline,
+    or in pool workers on the EngineBaseline set by init_worker, so workers load neither Django nor the ORM."""
+    if baseline is None:
+        baseline = engine_baseline
+    return [(pk, get_run_outputs(simulate_path(baseline, [CleanTechParams(**fields) for fields in cleantechs]),
+                                 world=country_code == 'WRL'))
+            for pk, cleantechs in jobs]
@@ -0,0 +1,125 @@
+import bisect
+import itertools
+import numpy as np
+from utils.constants import *
+from utils import sim_engine
+from utils.allcarbonfree_calcs import CleanTechObj, Path, get_cleantechs
+from utils.country_baselines import get_country_baseline
+from utils.path_engine import get_est_degree_rise
+from utils.path_results import get_path_key, PathResultCache
+
+response_surfaces = PathResultCache(RESPONSE_SURFACE_CACHE_SIZE)
+
+
+def get_axis(parameter, value, points):
+    low, high = RESPONSE_SURFACE_SPANS[parameter]
+    low, high = value * low, value * high
+    if parameter == 'limit_perc':
+        low, high = min(low, 1.), min(high, 1.)
+    return np.linspace(low, high, points if high > low else 1)
+
+
+class ResponseSurface:
+    """total_sim_emissions and carbon_zero_year of a Path on a grid of one CleanTech's parameters, interpolated
+    multilinearly between grid points. Values outside the grid are clamped to its edges; parameters left out of a
+    lookup keep the CleanTech's current values."""
+
+    def __init__(self, key, cleantech_id, parameters, axes, tables, current):
+        self.key = key
+        self.cleantech_id = cleantech_id
+        self.parameters = parameters
+        self.axes = [[float(value) for value in axis] for axis in axes]
+        self.tables = tables
+        self.current = {parameter: float(current[parameter]) for parameter in parameters}
+
+    def lookup(self, **values):
+        corners = []
+        for parameter, axis in zip(self.parameters, self.axes):
+            value = min(max(values.get(parameter, self.current[parameter]), axis[0]), axis[-1])
+            if len(axis) == 1:
+                corners.append(((0, 1.),))
+                continue
+            idx = min(bisect.bisect_right(axis, value) - 1, len(axis) - 2)
+            weight = (value - axis[idx]) / (axis[idx + 1] - axis[idx])
+            corners.append(((idx, 1. - weight), (idx + 1, weight)))
+
+        outputs = {}
+        for output, table in self.tables.items():
+            total = 0.
+            for corner in itertools.product(*corners):
+                weight = 1.
+                for _, corner_weight in corner:
+                    weight *= corner_weight
+                if weight:
+                    total += weight * table.item(tuple(idx for idx, _ in corner))
+            outputs[output] = total
+        outputs['carbon_zero_year'] = int(round(outputs['carbon_zero_year']))
+        outputs['est_degree_rise'] = round(get_est_degree_rise(outputs['total_sim_emissions']), 1)
+        return outputs
+
+    def as_dict(self):
+        return {'key': self.key, 'cleantech_id': self.cleantech_id, 'parameters': self.parameters, 'axes': self.axes,
+                'tables': {output: table.tolist() for output, table in self.tables.items()}, 'current': self.current}
+
+    @classmethod
+    def from_dict(cls, surface):
+        return cls(surface['key'], surface['cleantech_id'], surface['parameters'], surface['axes'],
+                   {output: np.array(table, dtype=np.float32) for output, table in surface['tables'].items()},
+                   surface['current'])
+
+
+def get_surface_key(path, cleantech_id, country_code='WRL'):
+    return get_path_key(get_cleantechs(path), path.starting_year, get_country_baseline(country_code).data_hash) + \
+        f'.{cleantech_id}'
+
+
+def build_response_surface(path, cleantech_id, parameters=None, points=RESPONSE_SURFACE_POINTS,
+                           batch_size=RESPONSE_SURFACE_BATCH_SIZE):
+    """Simulate the Path for every point of a grid spanning RESPONSE_SURFACE_SPANS around the CleanTech's current
+    parameters, in batches of batch_size grid points."""
+    parameters = list(RESPONSE_SURFACE_SPANS) if parameters is None else list(parameters)
+    all_carbon_free = Path('WRL', engine='array')
+    all_carbon_free.set_starting_year(path.starting_year)
+    cleantech_list = [CleanTechObj(**cleantech.__dict__) for cleantech in get_cleantechs(path)]
+    cleantech_ids = [cleantech.id for cleantech in cleantech_list]
+    if cleantech_id not in cleantech_ids:
+        raise ValueError(f'CleanTech {cleantech_id} is not in this Path')
+    all_carbon_free.set_cleantech_list(cleantech_list)
+    all_carbon_free.reset_to_latest_year()
+    layout, years, increments = all_carbon_free.get_array_inputs()
+
+    techs = all_carbon_free.fossil_list + all_carbon_free.non_fossil_list
+    target = cleantech_list[cleantech_ids.index(cleantech_id)]
+    slot = techs.index(target)
+    axes = [get_axis(parameter, getattr(target, parameter), points) for parameter in parameters]
+    grid = np.stack([values.ravel() for values in np.meshgrid(*axes, indexing='ij')], axis=1)
+
+    batch = sim_engine.TechBatch(layout, [techs])
+    start_row = layout.row_from_annual(all_carbon_free.annual)
+    total_sim_emissions = np.empty(len(grid))
+    carbon_zero_year = np.empty(len(grid))
+    for start in range(0, len(grid), batch_size):
+        grid_batch = grid[start:start + batch_size]
+        draws = batch.repeat(len(grid_batch))
+        for parameter_num, parameter in enumerate(parameters):
+            getattr(draws, parameter)[slot] = grid_batch[:, parameter_num]
+        history, n_years, _ = sim_engine.simulate_batch(layout, start_row, years, increments, draws,
+                                                        record=[layout.all], record_units=False)
+        total_sim_emissions[start:start + len(grid_batch)], carbon_zero_year[start:start + len(grid_batch)] = \
+            all_carbon_free.calc_batch_totals(years, history[:, :, 0], n_years)
+
+    shape = [len(axis) for axis in axes]
+    return ResponseSurface(get_surface_key(path, cleantech_id), cleantech_id, parameters, axes,
+                           {'total_sim_emissions': total_sim_emissions.reshape(shape).astype(np.float32),
+                            'carbon_zero_year': carbon_zero_year.reshape(shape).astype(np.float32)},
+                           {parameter: getattr(target, parameter) for parameter in parameters})
+
+
+def get_response_surface(path, cleantech_id):
+    """The cached ResponseSurface of the Path's current CleanTechs and country baseline, built if either changed."""
+    key = get_surface_key(path, cleantech_id)
+    surface = response_surfaces.get(key)
+    if surface is None:
+        surface = build_response_surface(path, cleantech_id)
+        response_surfaces.set(key, surface)
+    return surface
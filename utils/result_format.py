@@ -0,0 +1,120 @@
+import base64
+import json
+import struct
+import zlib
+import numpy as np
+import pandas as pd
+from utils.constants import *
+
+
+def encode_frame(df, encoding='delta'):
+    """Encode a numeric DataFrame as RESULT_FORMAT_PREFIX + base64(header length, JSON header, zlib payload), so it
+    fits the same text fields as the to_json(orient='split') strings.
+
+    'delta' rounds to whole numbers, like double_precision=0, and stores each column as int64 differences from the
+    previous year. 'float32' stores each column as float32, keeping NaN.
+    """
+    values = df.to_numpy(dtype=float)
+    index = df.index.to_numpy()
+    if not np.issubdtype(index.dtype, np.integer):
+        raise ValueError('Only integer indexes can be encoded')
+    if encoding == 'delta':
+        if not np.isfinite(values).all():
+            raise ValueError('delta encoding needs finite values, use float32')
+        payload = np.diff(np.rint(values).astype('<i8'), axis=0, prepend=0)
+    elif encoding == 'float32':
+        payload = values.astype('<f4')
+    else:
+        raise ValueError(f'Unknown encoding {encoding}, use one of {RESULT_FORMAT_ENCODINGS}')
+
+    header = json.dumps({'encoding': encoding, 'columns': list(df.columns), 'index_name': df.index.name,
+                         'shape': list(values.shape)}).encode()
+    body = np.diff(index.astype('<i8'), prepend=0).tobytes() + payload.T.tobytes()
+    data = struct.pack('<I', len(header)) + header + zlib.compress(body)
+    return RESULT_FORMAT_PREFIX + base64.b64encode(data).decode()
+
+
+def encode_country_df_lite(country_df_lite, result_format='json'):
+    if result_format == 'binary':
+        return encode_frame(country_df_lite, 'delta')
+    return country_df_lite.to_json(orient='split', double_precision=0)
+
+
+def get_run_outputs(run, result_format='json', world=True):
+    """get_path_outputs of a path_engine.PathRun, without a Path. world=False for a single country's run, see
+    PathRun.get_summary."""
+    country_df_lite = pd.DataFrame(run.get_frame_values(COUNTRY_DF_LITE_COLUMNS), columns=COUNTRY_DF_LITE_COLUMNS)
+    country_df_lite['year'] = country_df_lite['year'].astype(int)
+    outputs = {'country_df': encode_country_df_lite(country_df_lite.set_index('year'), result_format)}
+    outputs.update(run.get_summary(world))
+    return outputs
+
+
+def is_encoded(value):
+    return isinstance(value, str) and value.startswith(RESULT_FORMAT_PREFIX)
+
+
+def decode_frame(value):
+    """DataFrame from encode_frame output, or from a to_json(orient='split') string saved before it existed."""
+    if not is_encoded(value):
+        return pd.read_json(value, orient='split')
+    data = base64.b64decode(value[len(RESULT_FORMAT_PREFIX):])
+    header_len, = struct.unpack_from('<I', data)
+    header = json.loads(data[4:4 + header_len])
+    body = zlib.decompress(data[4 + header_len:])
+    n_rows, n_columns = header['shape']
+
+    index = np.cumsum(np.frombuffer(body, '<i8', n_rows))
+    if header['encoding'] == 'delta':
+        values = np.cumsum(np.frombuffer(body, '<i8', n_rows * n_columns, 8 * n_rows).reshape(n_columns, n_rows),
+                           axis=1)
+    else:
+        values = np.frombuffer(body, '<f4', n_rows * n_columns, 8 * n_rows).reshape(n_columns, n_rows)
+    return pd.DataFrame(values.T.astype(float), index=pd.Index(index, name=header['index_name']),
+                        columns=header['columns'])
+
+
+def get_json_view(value, double_precision=0):
+    """The to_json(orient='split') string older clients expect, whichever way the frame was saved."""
+    if not is_encoded(value):
+        return value
+    return decode_frame(value).to_json(orient='split', double_precision=double_precision)
+
+
+class LazyFrame:
+    """Decodes a saved frame the first time .df is read. Reads the field from the object at that point too, so a
+    field deferred in the queryset (e.g. country_df_full) is only fetched when it is needed."""
+
+    def __init__(self, obj, field='country_df'):
+        self.obj = obj
+        self.field = field
+        self._df = None
+
+    @property
+    def df(self):
+        if self._df is None:
+            self._df = decode_frame(getattr(self.obj, self.field))
+        return self._df
+
+    def to_json(self, double_precision=0):
+        return get_json_view(getattr(self.obj, self.field), double_precision)
+
+
+def encode_trajectories(trajectories, result_format='json'):
+    """Encode Path.get_cleantech_trajectories once: JSON with one (cleantechs x years) list per measure, whole numbers
+    and null before a CleanTech starts, or with result_format='binary' one float32 encode_frame per measure, indexed by
+    year with a column per CleanTech id."""
+    measures = [key for key in trajectories if key not in ('years', 'cleantech_ids')]
+    if result_format == 'binary':
+        columns = [str(cleantech_id) for cleantech_id in trajectories['cleantech_ids']]
+        index = pd.Index(trajectories['years'], name='year')
+        return json.dumps({measure: encode_frame(pd.DataFrame(trajectories[measure].T, index=index, columns=columns),
+                                                 'float32') for measure in measures})
+
+    outputs = {'years': np.asarray(trajectories['years']).tolist(),
+               'cleantech_ids': [str(cleantech_id) for cleantech_id in trajectories['cleantech_ids']]}
+    for measure in measures:
+        values = np.round(trajectories[measure]).astype(object)
+        values[np.isnan(trajectories[measure])] = None
+        outputs[measure] = values.tolist()
+    return json.dumps(outputs)
@@ -0,0 +1,467 @@
+import copy
+import numpy as np
+from utils.constants import *
+
+
+class StateLayout:
+    def __init__(self, subsectors):
+        self.subsectors = [ss_idx for sector_idx in SECTORS for ss_idx in SECTORS[sector_idx] if ss_idx in subsectors]
+        self.emission_keys = self.subsectors + list(SECTORS) + ['all', 'electricity']
+        self.electricity_keys = FOSSIL_TYPES + CARBON_FREE_TYPES + ['carbon_free', 'fossil']
+        self.keys = self.emission_keys + self.electricity_keys
+        self.columns = [f'{key}_emissions' for key in self.emission_keys] + \
+                       [f'{key}_electricity' for key in self.electricity_keys]
+        self.index = {key: idx for idx, key in enumerate(self.keys)}
+
+        self.subsector_slice = slice(0, len(self.subsectors))
+        self.sector_slices = []
+        start = 0
+        for sector_idx in SECTORS:
+            stop = start + len([ss_idx for ss_idx in SECTORS[sector_idx] if ss_idx in self.subsectors])
+            self.sector_slices.append((self.index[sector_idx], slice(start, stop)))
+            start = stop
+        self.sectors_slice = slice(self.index[list(SECTORS)[0]], self.index[list(SECTORS)[-1]] + 1)
+        self.fossil_slice = slice(self.index[FOSSIL_TYPES[0]], self.index[FOSSIL_TYPES[-1]] + 1)
+        self.carbon_free_slice = slice(self.index[CARBON_FREE_TYPES[0]], self.index[CARBON_FREE_TYPES[-1]] + 1)
+        self.fossil_co2 = np.array([CO2_LBS_PER_KWH[elec_type] for elec_type in FOSSIL_TYPES])
+        self.fossil_default_perc = np.array([1. if elec_type == 'gas' else 0. for elec_type in FOSSIL_TYPES])
+        self.heat = self.index['Electricity & heat']
+        self.all = self.index['all']
+        self.electricity = self.index['electricity']
+        self.carbon_free = self.index['carbon_free']
+        self.fossil = self.index['fossil']
+
+        self.sector_subsectors = [(sector_idx, [ss_idx for ss_idx in SECTORS[sector_idx] if ss_idx in self.subsectors])
+                                  for sector_idx in SECTORS]
+        self.subsector_sectors = {ss_idx: sector_idx for sector_idx, subsectors in self.sector_subsectors
+                                  for ss_idx in subsectors}
+        self.sector_matrix = np.zeros((len(self.sector_slices), len(self.subsectors)))
+        for sector_num, (_, ss_slice) in enumerate(self.sector_slices):
+            self.sector_matrix[sector_num, ss_slice] = 1
+
+    def row_from_annual(self, annual):
+        return np.array([annual.get(key, 0) for key in self.keys], dtype=float)
+
+    def annual_from_row(self, row):
+        return {key: row[idx] for idx, key in enumerate(self.keys)}
+
+    def subsector_columns(self, all_subsectors):
+        if not all_subsectors:
+            return None
+        return np.array([self.index[ss_idx] for ss_idx in all_subsectors], dtype=int)
+
+    def set_totals(self, row):
+        row[self.sectors_slice] = self.sector_matrix @ row[self.subsector_slice]
+        row[self.all] = row[self.sectors_slice].sum()
+        row[self.electricity] = TWH_TO_KWH * LBS_TO_TONS * (self.fossil_co2 @ row[self.fossil_slice])
+        row[self.carbon_free] = row[self.carbon_free_slice].sum()
+        row[self.fossil] = row[self.fossil_slice].sum()
+
+
+def get_increment_rows(increments, rows):
+    return None if increments is None else increments[rows]
+
+
+def sim_tech_year(layout, row, tech, columns, year):
+    if tech.replace_fossil:
+        tech.replace = row[layout.fossil]
+    elif columns is not None:
+        tech.replace = row[columns].sum()
+    else:
+        tech.replace = 0
+
+    if not (tech.replace > MAKE_ZERO and tech.start_year < year):
+        return
+
+    delta_exp = tech.growth_rate * (tech.units_per_year[-1] - tech.units_per_year[-2])
+    if delta_exp > tech.max_prod:
+        tech.max_prod = delta_exp
+    all_units = tech.limit_perc * (tech.replace / tech.limiter_unit + tech.units_per_year[-1])
+    output_delta = min(max(tech.saturation_rate * (all_units - tech.units_per_year[-1]), 0), tech.max_prod)
+
+    if columns is not None:
+        emissions = row[columns]
+        emissions_sum = emissions.sum()
+        if tech.replace < output_delta * tech.CO2_reduced_per_unit:
+            output_delta = tech.replace / tech.CO2_reduced_per_unit
+        if emissions_sum > 0:
+            emissions = emissions - emissions / emissions_sum * output_delta * tech.CO2_reduced_per_unit
+            emissions[emissions < MAKE_ZERO] = 0
+            row[columns] = emissions
+
+    tech.add_to_annual_output(tech.units_per_year[-1] + output_delta)
+
+    fossil = row[layout.fossil]
+    if (tech.electric_generation_type == 'fossil') or (tech.electric_generation_type is None):
+        if (tech.replace - output_delta * tech.limiter_unit) < MAKE_ZERO:
+            output_delta = 0
+
+        if fossil > 0:
+            elec_type_perc = row[layout.fossil_slice] / fossil
+        else:
+            elec_type_perc = layout.fossil_default_perc
+        row[layout.fossil_slice] += elec_type_perc * output_delta * tech.electric_energy_per_unit
+        heat_added = layout.fossil_co2 * tech.electric_energy_per_unit * elec_type_perc * output_delta * \
+            TWH_TO_KWH * LBS_TO_TONS
+        for added in heat_added:
+            row[layout.heat] += added
+    else:
+        row[layout.index[tech.electric_generation_type]] += output_delta * tech.electric_energy_per_unit
+
+        if tech.replace_fossil and fossil > 0:
+            for elec_idx in range(layout.fossil_slice.start, layout.fossil_slice.stop):
+                elec_type_perc = row[elec_idx] / fossil
+                row[elec_idx] -= elec_type_perc * output_delta
+                if row[elec_idx] < MAKE_ZERO:
+                    row[elec_idx] = 0
+                if row[layout.heat] > 0:
+                    row[layout.heat] -= layout.fossil_co2[elec_idx - layout.fossil_slice.start] * elec_type_perc * \
+                                        output_delta * TWH_TO_KWH * LBS_TO_TONS
+                if row[layout.heat] < MAKE_ZERO:
+                    row[layout.heat] = 0
+
+    layout.set_totals(row)
+
+
+def iter_simulate_array(layout, start_row, years, increments, techs, stop=None):
+    """Yield each year's row and a (techs x 2) array of each tech's units_per_year length and max_prod, stopping
+    after the year all emissions reach MAKE_ZERO or stop(row, year_num) returns True."""
+    tech_columns = [layout.subsector_columns(tech.all_subsectors) for tech in techs]
+    row = np.asarray(start_row, dtype=float)
+    for year_num, year_idx in enumerate(years):
+        row = row.copy()
+
+        if increments is not None:
+            row[layout.subsector_slice] += increments[year_num]
+            layout.set_totals(row)
+
+        for tech, columns in zip(techs, tech_columns):
+            sim_tech_year(layout, row, tech, columns, year_idx)
+
+        yield row, np.array([(len(tech.units_per_year), tech.max_prod) for tech in techs]).reshape(len(techs), 2)
+        if row[layout.all] < MAKE_ZERO or (stop is not None and stop(row, year_num)):
+            return
+
+
+def get_steps_per_year(time_resolution):
+    if time_resolution not in TIME_RESOLUTIONS:
+        raise ValueError(f'Unknown time_resolution {time_resolution}, use one of {list(TIME_RESOLUTIONS)}')
+    return TIME_RESOLUTIONS[time_resolution]
+
+
+def simulate_array(layout, start_row, years, increments, techs, stop=None, steps_per_year=1):
+    """Run the yearly loop on a preallocated (years x layout.keys) matrix.
+
+    Returns the matrix, the rows used and a (years x techs x 2) record of each tech's units_per_year length and
+    max_prod at the end of every year. stop(row, year_num) may end the run early once it returns True. With
+    steps_per_year > 1 the years are simulated by iter_simulate_steps.
+    """
+    state = np.empty((len(years), len(layout.keys)))
+    tech_states = np.empty((len(years), len(techs), 2))
+    n_years = 0
+    if steps_per_year == 1:
+        rows = iter_simulate_array(layout, start_row, years, increments, techs, stop)
+    else:
+        rows = ((row, tech_state) for row, tech_state, _ in
+                iter_simulate_steps(layout, start_row, years, increments, techs, steps_per_year, stop))
+    for row, tech_state in rows:
+        state[n_years] = row
+        tech_states[n_years] = tech_state
+        n_years += 1
+    return state, n_years, tech_states
+
+
+class TechBatch:
+    """Per-slot tech parameters of a batch of scenarios, laid out (slots x scenarios) so a slot is contiguous."""
+
+    def __init__(self, layout, scenarios):
+        n_scenarios = len(scenarios)
+        n_slots = max([len(techs) for techs in scenarios] + [1])
+        n_subsectors = len(layout.subsectors)
+        shape = (n_slots, n_scenarios)
+
+        self.valid = np.zeros(shape, dtype=bool)
+        self.replace_fossil = np.zeros(shape, dtype=bool)
+        self.fossil_generation = np.zeros(shape, dtype=bool)
+        self.generation_column = np.zeros(shape, dtype=int)
+        self.subsector_mask = np.zeros((n_slots, n_subsectors, n_scenarios), dtype=bool)
+        self.has_subsectors = np.zeros(shape, dtype=bool)
+        for name in ['start_year', 'growth_rate', 'saturation_rate', 'limit_perc', 'limiter_unit',
+                     'CO2_reduced_per_unit', 'electric_energy_per_unit', 'max_prod', 'units_prev', 'units_last']:
+            setattr(self, name, np.zeros(shape))
+
+        for scenario_idx, techs in enumerate(scenarios):
+            for slot_idx, tech in enumerate(techs):
+                idx = (slot_idx, scenario_idx)
+                self.valid[idx] = True
+                self.replace_fossil[idx] = bool(tech.replace_fossil)
+                self.fossil_generation[idx] = (tech.electric_generation_type == 'fossil') or \
+                                              (tech.electric_generation_type is None)
+                if not self.fossil_generation[idx]:
+                    self.generation_column[idx] = layout.index[tech.electric_generation_type]
+                columns = layout.subsector_columns(tech.all_subsectors)
+                if columns is not None:
+                    self.subsector_mask[slot_idx, columns, scenario_idx] = True
+                    self.has_subsectors[idx] = True
+                for name in ['start_year', 'growth_rate', 'saturation_rate', 'limit_perc', 'limiter_unit',
+                             'CO2_reduced_per_unit', 'electric_energy_per_unit', 'max_prod']:
+                    getattr(self, name)[idx] = getattr(tech, name)
+                self.units_prev[idx] = tech.units_per_year[-2]
+                self.units_last[idx] = tech.units_per_year[-1]
+        self.set_slot_columns()
+
+    def set_slot_columns(self):
+        self.slot_columns = [np.flatnonzero(slot_mask.any(axis=1)) for slot_mask in self.subsector_mask]
+        self.slot_masks = [slot_mask[columns] for slot_mask, columns in zip(self.subsector_mask, self.slot_columns)]
+
+    def repeat(self, n_repeats):
+        batch = copy.copy(self)
+        for name, value in self.__dict__.items():
+            if isinstance(value, np.ndarray):
+                setattr(batch, name, np.repeat(value, n_repeats, axis=-1))
+        batch.set_slot_columns()
+        return batch
+
+
+def set_totals_batch(layout, state, rows):
+    """set_totals on the (layout.keys x scenarios) state, for the scenarios in rows only."""
+    np.copyto(state[layout.sectors_slice], layout.sector_matrix @ state[layout.subsector_slice], where=rows)
+    np.copyto(state[layout.all], state[layout.sectors_slice].sum(axis=0), where=rows)
+    np.copyto(state[layout.electricity], TWH_TO_KWH * LBS_TO_TONS * (layout.fossil_co2 @ state[layout.fossil_slice]),
+              where=rows)
+    np.copyto(state[layout.carbon_free], state[layout.carbon_free_slice].sum(axis=0), where=rows)
+    np.copyto(state[layout.fossil], state[layout.fossil_slice].sum(axis=0), where=rows)
+
+
+def sim_slot_year(layout, state, batch, slot_idx, year, running):
+    j = slot_idx
+    ss = batch.slot_columns[j]
+    fossil = state[layout.fossil]
+    replace_fossil = batch.replace_fossil[j]
+    if len(ss):
+        mask = batch.slot_masks[j]
+        emissions = np.where(mask, state[ss], 0.)
+        replace = np.where(replace_fossil, fossil, emissions.sum(axis=0))
+    else:
+        replace = np.where(replace_fossil, fossil, 0.)
+
+    go = running & batch.valid[j] & (replace > MAKE_ZERO) & (batch.start_year[j] < year)
+    if not go.any():
+        return None
+
+    units_last, units_prev = batch.units_last[j], batch.units_prev[j]
+    delta_exp = batch.growth_rate[j] * (units_last - units_prev)
+    max_prod = np.where(go & (delta_exp > batch.max_prod[j]), delta_exp, batch.max_prod[j])
+    batch.max_prod[j] = max_prod
+    all_units = batch.limit_perc[j] * (replace / batch.limiter_unit[j] + units_last)
+    output_delta = np.minimum(np.maximum(batch.saturation_rate[j] * (all_units - units_last), 0), max_prod)
+    output_delta = np.where(go, output_delta, 0.)
+
+    co2 = batch.CO2_reduced_per_unit[j]
+    has_subsectors = go & batch.has_subsectors[j]
+    if has_subsectors.any():
+        emissions_sum = emissions.sum(axis=0)
+        output_delta = np.where(has_subsectors & (replace < output_delta * co2), replace / co2, output_delta)
+        reduce = has_subsectors & (emissions_sum > 0)
+        reduced = emissions - emissions / emissions_sum * output_delta * co2
+        reduced[reduced < MAKE_ZERO] = 0
+        state[ss] = np.where(mask & reduce, reduced, state[ss])
+
+    batch.units_prev[j] = np.where(go, units_last, units_prev)
+    batch.units_last[j] = units_last + output_delta
+
+    eepu = batch.electric_energy_per_unit[j]
+    fossil_generation = go & batch.fossil_generation[j]
+    if fossil_generation.any():
+        fossil_delta = np.where(fossil_generation & (replace - output_delta * batch.limiter_unit[j] >= MAKE_ZERO),
+                                output_delta, 0.)
+        elec_type_perc = np.where(fossil > 0, state[layout.fossil_slice] / np.where(fossil > 0, fossil, 1.),
+                                  layout.fossil_default_perc[:, None])
+        state[layout.fossil_slice] += elec_type_perc * fossil_delta * eepu
+        heat_added = layout.fossil_co2[:, None] * eepu * elec_type_perc * fossil_delta * TWH_TO_KWH * LBS_TO_TONS
+        for added in heat_added:
+            state[layout.heat] += added
+
+    clean_generation = go & ~batch.fossil_generation[j]
+    if clean_generation.any():
+        rows = np.flatnonzero(clean_generation)
+        state[batch.generation_column[j, rows], rows] += output_delta[rows] * eepu[rows]
+
+        replace_rows = clean_generation & replace_fossil & (fossil > 0)
+        if replace_rows.any():
+            rows = np.flatnonzero(replace_rows)
+            fossil_rows = fossil[rows]
+            delta_rows = output_delta[rows]
+            heat = state[layout.heat, rows]
+            for elec_num, elec_idx in enumerate(range(layout.fossil_slice.start, layout.fossil_slice.stop)):
+                elec = state[elec_idx, rows]
+                elec_type_perc = elec / fossil_rows
+                elec = elec - elec_type_perc * delta_rows
+                elec[elec < MAKE_ZERO] = 0
+                state[elec_idx, rows] = elec
+                heat = np.where(heat > 0, heat - layout.fossil_co2[elec_num] * elec_type_perc * delta_rows *
+                                TWH_TO_KWH * LBS_TO_TONS, heat)
+                heat[heat < MAKE_ZERO] = 0
+            state[layout.heat, rows] = heat
+
+    set_totals_batch(layout, state, go)
+    return go
+
+
+def simulate_batch(layout, start_row, years, increments, batch, record=None, record_units=True):
+    """Run every scenario of a TechBatch in lockstep from the same start row.
+
+    Returns the (years x scenarios x layout.keys) state history, or only the record columns, the number of years
+    each scenario ran before reaching MAKE_ZERO, and the (years x scenarios x slots) units of each tech slot, NaN
+    where a slot did not step (None unless record_units).
+    """
+    n_slots, n_scenarios = batch.valid.shape
+    record = np.arange(len(layout.keys)) if record is None else np.asarray(record)
+    history = np.empty((len(years), n_scenarios, len(record)))
+    units = np.full((len(years), n_scenarios, n_slots), np.nan) if record_units else None
+    n_years = np.full(n_scenarios, len(years))
+    running = np.ones(n_scenarios, dtype=bool)
+    state = np.repeat(np.asarray(start_row, dtype=float)[:, None], n_scenarios, axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for year_num, year_idx in enumerate(years):
+            if increments is not None:
+                state[layout.subsector_slice] += np.where(running, increments[year_num][:, None], 0.)
+                set_totals_batch(layout, state, running)
+
+            for slot_idx in range(n_slots):
+                go = sim_slot_year(layout, state, batch, slot_idx, year_idx, running)
+                if go is not None and record_units:
+                    units[year_num, go, slot_idx] = batch.units_last[slot_idx, go]
+
+            history[year_num] = state[record].T
+            done = running & (state[layout.all] < MAKE_ZERO)
+            n_years[done] = year_num + 1
+            running &= ~done
+            if not running.any():
+                return history[:year_num + 1], n_years, units if units is None else units[:year_num + 1]
+    return history, n_years, units
+
+
+class StepTechs:
+    """The parameters and running units of a path's techs as (techs,) arrays, with the yearly rates rescaled to steps
+    of 1 / steps_per_year year.
+
+    growth_rate and saturation_rate compound to their yearly values over a year of steps, the production cap
+    max_prod and the starting production (units_last - units_prev) are per step, and limit_perc is unchanged.
+    """
+
+    def __init__(self, layout, techs, steps_per_year):
+        batch = TechBatch(layout, [techs])
+        for name, value in batch.__dict__.items():
+            if isinstance(value, np.ndarray):
+                setattr(self, name, value[..., 0])
+        self.subsector_mask = self.subsector_mask.astype(float)
+        self.fossil_group = self.valid & self.fossil_generation
+        self.clean_group = self.valid & ~self.fossil_generation
+
+        self.steps_per_year = steps_per_year
+        self.growth_rate = self.growth_rate ** (1 / steps_per_year)
+        self.saturation_rate = 1 - (1 - np.minimum(self.saturation_rate, 1)) ** (1 / steps_per_year)
+        self.max_prod = self.max_prod / steps_per_year
+        self.units_prev = self.units_last - (self.units_last - self.units_prev) / steps_per_year
+
+
+def sim_group_step(layout, row, techs, group, year):
+    """One step of every tech in group at once, each sizing its output from the row as the group found it, as
+    sim_tech_year does for one tech. Returns which techs stepped."""
+    emissions = row[layout.subsector_slice]
+    fossil = row[layout.fossil]
+    emissions_sums = techs.subsector_mask @ emissions
+    replace = np.where(techs.replace_fossil, fossil, emissions_sums)
+    go = group & (replace > MAKE_ZERO) & (techs.start_year < year)
+    if not go.any():
+        return go
+
+    units_last = techs.units_last
+    delta_exp = techs.growth_rate * (units_last - techs.units_prev)
+    techs.max_prod = np.where(go & (delta_exp > techs.max_prod), delta_exp, techs.max_prod)
+    all_units = techs.limit_perc * (replace / techs.limiter_unit + units_last)
+    output_delta = np.minimum(np.maximum(techs.saturation_rate * (all_units - units_last), 0), techs.max_prod)
+    output_delta = np.where(go, output_delta, 0.)
+
+    co2 = techs.CO2_reduced_per_unit
+    has_subsectors = go & techs.has_subsectors
+    if has_subsectors.any():
+        output_delta = np.where(has_subsectors & (replace < output_delta * co2), replace / co2, output_delta)
+        reduced_share = np.where(has_subsectors & (emissions_sums > 0), output_delta * co2 / emissions_sums, 0.)
+        reduced_share = reduced_share @ techs.subsector_mask
+        reduced = emissions - emissions * reduced_share
+        reduced[reduced < MAKE_ZERO] = 0
+        row[layout.subsector_slice] = np.where(reduced_share > 0, reduced, emissions)
+
+    techs.units_prev = np.where(go, units_last, techs.units_prev)
+    techs.units_last = units_last + output_delta
+
+    electricity = output_delta * techs.electric_energy_per_unit
+    fossil_generation = go & techs.fossil_generation
+    if fossil_generation.any():
+        fossil_added = electricity[fossil_generation & (replace - output_delta * techs.limiter_unit >= MAKE_ZERO)].sum()
+        elec_type_perc = row[layout.fossil_slice] / fossil if fossil > 0 else layout.fossil_default_perc
+        row[layout.fossil_slice] += elec_type_perc * fossil_added
+        row[layout.heat] += (layout.fossil_co2 @ elec_type_perc) * fossil_added * TWH_TO_KWH * LBS_TO_TONS
+
+    clean_generation = go & ~techs.fossil_generation
+    if clean_generation.any():
+        np.add.at(row, techs.generation_column[clean_generation], electricity[clean_generation])
+        if fossil > 0:
+            fossil_replaced = output_delta[clean_generation & techs.replace_fossil].sum()
+            elec_type_perc = row[layout.fossil_slice] / fossil
+            elec = row[layout.fossil_slice] - elec_type_perc * fossil_replaced
+            elec[elec < MAKE_ZERO] = 0
+            row[layout.fossil_slice] = elec
+            if row[layout.heat] > 0:
+                row[layout.heat] -= (layout.fossil_co2 @ elec_type_perc) * fossil_replaced * TWH_TO_KWH * LBS_TO_TONS
+            if row[layout.heat] < MAKE_ZERO:
+                row[layout.heat] = 0
+
+    layout.set_totals(row)
+    return go
+
+
+def iter_simulate_steps(layout, start_row, years, increments, techs, steps_per_year, stop=None):
+    """iter_simulate_array with each year split into steps_per_year steps.
+
+    Each year's energy use increment is spread evenly over its steps. In a step the fossil-powered techs run
+    together, then the others, with sim_group_step, so a step costs the same few array operations whatever the
+    number of techs; order effects within a group shrink with the step length. Yields each year's mean row over its
+    steps (the last row held for the rest of the year once all emissions reach MAKE_ZERO), the techs' yearly
+    units_per_year length and max_prod, appending each tech's units at the end of every year it stepped in, and
+    whether all emissions reached MAKE_ZERO in that year, which the mean row does not show.
+    """
+    step_techs = StepTechs(layout, techs, steps_per_year)
+    groups = [group for group in (step_techs.fossil_group, step_techs.clean_group) if group.any()]
+    row = np.array(start_row, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for year_num, year_idx in enumerate(years):
+            year_row = np.zeros_like(row)
+            stepped = np.zeros(len(step_techs.valid), dtype=bool)
+            for step_num in range(steps_per_year):
+                if increments is not None:
+                    row[layout.subsector_slice] += increments[year_num] / steps_per_year
+                    layout.set_totals(row)
+
+                for group in groups:
+                    stepped |= sim_group_step(layout, row, step_techs, group, year_idx)
+
+                year_row += row
+                if row[layout.all] < MAKE_ZERO:
+                    year_row += (steps_per_year - step_num - 1) * row
+                    break
+            year_row /= steps_per_year
+
+            for tech_num, tech in enumerate(techs):
+                if stepped[tech_num]:
+                    tech.add_to_annual_output(step_techs.units_last[tech_num])
+                    tech.max_prod = step_techs.max_prod[tech_num] * steps_per_year
+
+            tech_state = np.array([(len(tech.units_per_year), tech.max_prod) for tech in techs])
+            terminated = row[layout.all] < MAKE_ZERO
+            yield year_row, tech_state.reshape(len(techs), 2), terminated
+            if terminated or (stop is not None and stop(year_row, year_num)):
+                return